@@ -1,11 +1,12 @@
 import weave
-from openai import OpenAI
 from pydantic import BaseModel
 
 import config
+from cache_utils import cached_call
+from client_utils import get_client
 
 weave.init(config.WEAVE_PROJECT)
-client = OpenAI()
+client = get_client()
 
 
 class SentenceEntities(BaseModel):
@@ -13,14 +14,18 @@ class SentenceEntities(BaseModel):
 
 
 @weave.op()
-def response(instructions: str, user_input: str, format: BaseModel):
-    response = client.responses.parse(
-        model="gpt-4.1",
-        instructions=instructions,
-        input=user_input,
-        format=SentenceEntities,
+def response(
+    instructions: str, user_input: str, format: BaseModel, cache: bool = False
+):
+    request = {"model": "gpt-4.1", "instructions": instructions, "input": user_input}
+    parsed = cached_call(
+        {**request, "format": SentenceEntities.model_json_schema()},
+        lambda: client.responses.parse(
+            **request, format=SentenceEntities
+        ).output_parsed.model_dump_json(),
+        cache,
     )
-    return response.output_parsed
+    return SentenceEntities.model_validate_json(parsed)
 
 
 @weave.op()
@@ -1,26 +1,164 @@
+import contextvars
+import json
+import os
+import re
+import sys
+import textwrap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
 import weave
-from openai import OpenAI
 
 import config
+from cache_utils import cached_call
+from client_utils import get_client
+from utils import estimate_tokens, parallel_map
 
 weave.init(project_name=config.WEAVE_PROJECT)
-client = OpenAI()
+client = get_client()
 
 
 @weave.op()
-def response(instructions: str, user_input: str):
-    response = client.responses.create(
-        model="gpt-4.1",
-        instructions=instructions,
-        input=user_input,
+def response(instructions: str, user_input: str, cache: bool = False):
+    request = {"model": "gpt-4.1", "instructions": instructions, "input": user_input}
+    return cached_call(
+        request,
+        lambda: client.responses.create(**request).output[0].content[0].text,
+        cache,
     )
-    return response.output[0].content[0].text
 
 
 @weave.op()
-def process_transcript(transcript: str):
-    summary = response("Summarize into 3-5 sentences", transcript)
-    tone = response("Determine the tone of the transcript", transcript)
+def fan_out(
+    instructions: list[str],
+    user_input: str,
+    max_workers: Optional[int] = None,
+    cache: bool = False,
+) -> list[str]:
+    """Run independent instruction prompts over the same input concurrently."""
+    return parallel_map(
+        lambda instruction: response(instruction, user_input, cache),
+        instructions,
+        max_workers,
+    )
+
+
+# ---------- long transcripts ------------------------------------------
+_TURN_START = re.compile(r"^[^\s:][^:\n]{0,40}:\s")  # "Interviewer: ..."
+
+
+def split_turns(transcript: str) -> list[str]:
+    """Split a transcript into speaker turns; unlabelled lines continue the last turn."""
+    turns = []
+    for line in transcript.splitlines():
+        if not line.strip():
+            continue
+        if turns and not _TURN_START.match(line):
+            turns[-1] += "\n" + line
+        else:
+            turns.append(line)
+    return turns
+
+
+def pack_by_tokens(pieces: list[str], max_tokens: int, sep: str = "\n") -> list[str]:
+    """Join consecutive whole pieces into windows of at most ~`max_tokens` tokens."""
+    chunks, window, size = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if window and size + tokens > max_tokens:
+            chunks.append(sep.join(window))
+            window, size = [], 0
+        window.append(piece)
+        size += tokens
+    if window:
+        chunks.append(sep.join(window))
+    return chunks
+
+
+def chunk_transcript(transcript: str, max_tokens: int = 2000) -> list[str]:
+    """Pack whole speaker turns into windows of at most ~`max_tokens` tokens."""
+    pieces = []
+    for turn in split_turns(transcript):
+        # a single turn longer than the window is wrapped on word boundaries
+        if estimate_tokens(turn) <= max_tokens:
+            pieces.append(turn)
+        else:
+            pieces += textwrap.wrap(
+                turn, width=max_tokens * 4, replace_whitespace=False
+            )
+    return pack_by_tokens(pieces, max_tokens)
+
+
+@weave.op()
+def map_reduce(
+    instructions: str,
+    transcript: str,
+    chunk_tokens: int = 2000,
+    max_workers: Optional[int] = 8,
+    cache: bool = False,
+) -> str:
+    """
+    Answer `instructions` over a long transcript: each chunk is answered in
+    parallel, then partial answers are combined, in parallel rounds while they
+    still exceed one chunk, so latency grows with log(length), not length.
+    """
+    chunks = chunk_transcript(transcript, chunk_tokens)
+    if len(chunks) <= 1:
+        return response(instructions, transcript, cache)
+
+    part_instructions = (
+        f"{instructions}\nThe input is one part of a longer transcript; "
+        "answer for this part only."
+    )
+    partials = parallel_map(
+        lambda chunk: response(part_instructions, chunk, cache), chunks, max_workers
+    )
+
+    combine_instructions = (
+        f"{instructions}\nThe input contains answers for consecutive parts of one "
+        "transcript; combine them into a single answer for the whole transcript."
+    )
+    while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > chunk_tokens:
+        # group whole partial answers; never split one mid-sentence
+        groups = pack_by_tokens(partials, chunk_tokens, sep="\n\n")
+        if len(groups) == len(partials):
+            break  # partial answers no longer shrink; combine them in one go
+        partials = parallel_map(
+            lambda group: response(combine_instructions, group, cache),
+            groups,
+            max_workers,
+        )
+    return response(combine_instructions, "\n\n".join(partials), cache)
+
+
+TRANSCRIPT_ANALYSES = [
+    "Summarize into 3-5 sentences",
+    "Determine the tone of the transcript",
+]
+
+
+@weave.op()
+def process_transcript(
+    transcript: str,
+    chunk_tokens: Optional[int] = None,
+    cache: bool = False,
+    max_workers: Optional[int] = 8,
+):
+    """
+    Summary and tone of a transcript; map-reduce over chunks when it exceeds
+    `chunk_tokens`, with at most `max_workers` concurrent calls per analysis.
+    """
+    if chunk_tokens and estimate_tokens(transcript) > chunk_tokens:
+        summary, tone = parallel_map(
+            lambda instructions: map_reduce(
+                instructions, transcript, chunk_tokens, max_workers, cache
+            ),
+            TRANSCRIPT_ANALYSES,
+        )
+    else:
+        summary, tone = fan_out(TRANSCRIPT_ANALYSES, transcript, max_workers, cache)
     return summary, tone
 
 
@@ -43,5 +181,100 @@ def chapter_1_workflow():
     print(tone)
 
 
+# ---------- batch processing ------------------------------------------
+def iter_jsonl(path: str, offset: int = 0):
+    """Stream `(end_offset, record)` pairs from a JSONL file, starting at byte `offset`."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.strip():
+                offset += len(line)
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line.endswith(b"\n"):
+                    raise
+                break  # partially written last line; pick it up on the next run
+            offset += len(line)
+            yield offset, record
+
+
+def _read_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"input_offset": 0, "output_offset": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def process_transcripts_jsonl(
+    input_path: str,
+    output_path: str,
+    workers: int = 8,
+    field: str = "transcript",
+    chunk_tokens: Optional[int] = None,
+    cache: bool = False,
+    max_workers: Optional[int] = 8,
+) -> int:
+    """
+    Summarize every record of `input_path` into `output_path`, one JSON line each.
+
+    Records are streamed, at most `2 * workers` are in flight (each making at
+    most `max_workers` concurrent calls, see `process_transcript`), and results
+    are written in input order. After each written line the input/output offsets
+    are committed to `<output_path>.offset`, so an interrupted run resumes
+    from the last committed record without duplicating output.
+    """
+    checkpoint_path = output_path + ".offset"
+    checkpoint = _read_checkpoint(checkpoint_path)
+    process = partial(
+        process_transcript,
+        chunk_tokens=chunk_tokens,
+        cache=cache,
+        max_workers=max_workers,
+    )
+    processed = 0
+
+    with open(output_path, "ab") as out, ThreadPoolExecutor(workers) as pool:
+        out.truncate(checkpoint["output_offset"])  # drop output past the checkpoint
+        pending = deque()
+
+        def commit_oldest():
+            end, record, future = pending.popleft()
+            summary, tone = future.result()
+            result = {k: v for k, v in record.items() if k != field}
+            result.update(summary=summary, tone=tone)
+            out.write((json.dumps(result) + "\n").encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.update(input_offset=end, output_offset=out.tell())
+            _write_checkpoint(checkpoint_path, checkpoint)
+
+        for end, record in iter_jsonl(input_path, checkpoint["input_offset"]):
+            future = pool.submit(contextvars.copy_context().run, process, record[field])
+            pending.append((end, record, future))
+            if len(pending) >= 2 * workers:
+                commit_oldest()
+                processed += 1
+        while pending:
+            commit_oldest()
+            processed += 1
+
+    return processed
+
+
 if __name__ == "__main__":
-    chapter_1_workflow()
+    if len(sys.argv) == 3:
+        # python _1_workflow.py transcripts.jsonl results.jsonl
+        print(f"Processed {process_transcripts_jsonl(*sys.argv[1:])} transcripts")
+    else:
+        chapter_1_workflow()
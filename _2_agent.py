@@ -1,10 +1,14 @@
+import asyncio
+import inspect
 import json
 
 import weave
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 import config
-from utils import fn_to_schema, tag
+from cache_utils import acached_stream, cached_stream
+from client_utils import get_async_client, get_client
+from utils import arg_parser, fn_to_schema, parallel_map, pure_tool, tag
 
 weave.init(project_name=config.WEAVE_PROJECT)
 
@@ -12,15 +16,25 @@ weave.init(project_name=config.WEAVE_PROJECT)
 class MiniAgent(weave.Model):
 
     client: OpenAI = None
+    # injection hook only: unset, `arun` uses the shared client of its running loop
+    aclient: AsyncOpenAI = None
     instructions: str = ""
     model: str = "o4-mini"
     tools: dict = {}
     tools_schema: list = []
-
-    def __init__(self, instructions: str, tools: list, model: str = "o4-mini"):
+    parallel_tool_calls: bool = False
+
+    def __init__(
+        self,
+        instructions: str,
+        tools: list,
+        model: str = "o4-mini",
+        parallel_tool_calls: bool = False,
+    ):
         super().__init__()
-        self.client = OpenAI()
+        self.client = get_client()
         self.instructions, self.model = instructions, model
+        self.parallel_tool_calls = parallel_tool_calls
         self.tools = {fn.__name__: fn for fn in tools}
         self.tools_schema = [fn_to_schema(fn) for fn in tools]
 
@@ -37,58 +51,152 @@ class MiniAgent(weave.Model):
             return []
 
         if item.type == "function_call":
-            args = json.loads(item.arguments or "{}")
-            print(tag("function_call") + f"{item.name}({json.dumps(args)})")
-            result = self.tools[item.name](**args) if args else self.tools[item.name]()
-            print(tag("function_output") + json.dumps(result))
-            return [
-                {
-                    "type": "function_call_output",
-                    "call_id": item.call_id,
-                    "output": json.dumps(result),
-                }
-            ]
+            return self._run_tool_calls([item])
 
         return []
-    
+
+    # ---------- tool execution -----------------------------------------
+    def _call_tool(self, item):
+        tool = self.tools[item.name]
+        args = arg_parser(tool)(item.arguments)
+        print(tag("function_call") + f"{item.name}({item.arguments or '{}'})")
+        return tool(**args) if args else tool()
+
+    def _call_tool_blocking(self, item):
+        """Sync-path call; an async tool gets a private loop in this worker thread."""
+        result = self._call_tool(item)
+        return asyncio.run(result) if inspect.iscoroutine(result) else result
+
+    def _tool_output(self, item, result):
+        output = json.dumps(result)
+        print(tag("function_output") + output)
+        return {
+            "type": "function_call_output",
+            "call_id": item.call_id,
+            "output": output,
+        }
+
+    def tool_cache_stats(self):
+        """Hit/miss counters of every tool marked with `@pure_tool`."""
+        return {
+            name: fn.cache.stats()
+            for name, fn in self.tools.items()
+            if hasattr(fn, "cache")
+        }
+
+    async def _gather_tool_calls(self, calls):
+        """Run all function calls of one turn concurrently, keeping call order.
+
+        Async tools run as tasks on the current loop, sync tools in threads.
+        """
+
+        async def call_one(call):
+            if inspect.iscoroutinefunction(self.tools[call.name]):
+                return await self._call_tool(call)
+            return await asyncio.to_thread(self._call_tool, call)
+
+        results = await asyncio.gather(*(call_one(call) for call in calls))
+        return [self._tool_output(call, r) for call, r in zip(calls, results)]
+
+    def _run_tool_calls(self, calls):
+        """Sync twin of `_gather_tool_calls`: tools fan out on a thread pool, so
+        `run` also works when its caller is already inside an event loop.
+        """
+        results = parallel_map(self._call_tool_blocking, calls)
+        return [self._tool_output(call, r) for call, r in zip(calls, results)]
+
+    def _request(self, turn_input, prev_id):
+        return {
+            "model": self.model,
+            "instructions": self.instructions,
+            "tools": self.tools_schema,
+            "input": turn_input,
+            "previous_response_id": prev_id,
+        }
+
+    @weave.op()
+    def _think(self, turn_input, prev_id, cache: bool = False):
+        request = self._request(turn_input, prev_id)
+        if cache:
+            return cached_stream(
+                request, lambda: self.client.responses.create(**request, stream=True)
+            )
+        return self.client.responses.create(**request, stream=True)
+
     @weave.op()
-    def _think(self, turn_input, prev_id):
-        stream = self.client.responses.create(
-                model=self.model,
-                instructions=self.instructions,
-                tools=self.tools_schema,
-                input=turn_input,
-                previous_response_id=prev_id,
-                stream=True,
+    async def _athink(self, turn_input, prev_id, cache: bool = False):
+        request = self._request(turn_input, prev_id)
+        aclient = self.aclient or get_async_client()
+        if cache:
+            return acached_stream(
+                request, lambda: aclient.responses.create(**request, stream=True)
             )
-        return stream
+        return await aclient.responses.create(**request, stream=True)
 
     # ---------- main loop ----------------------------------------------
     @weave.op()
-    def run(self, user_text: str):
+    def run(self, user_text: str, cache: bool = False):
         print("Input:", user_text)
         turn_input = [{"role": "user", "content": user_text}]
         prev_id, items = None, []
 
         while turn_input:
-            stream = self._think(turn_input, prev_id)
-            turn_input = []  # collect next‑turn inputs
+            stream = self._think(turn_input, prev_id, cache)
+            turn_input, calls = [], []  # collect next‑turn inputs
 
             for event in stream:
                 if event.type == "response.output_item.done":
-                    turn_input += self._handle_item(event.item)
-                    items.append(event.item)
+                    item = event.item
+                    if self.parallel_tool_calls and item.type == "function_call":
+                        calls.append(item)  # dispatched together below
+                    else:
+                        turn_input += self._handle_item(item)
+                    items.append(item)
+
+                if event.type == "response.completed":
+                    prev_id = event.response.id
+
+            turn_input += self._run_tool_calls(calls)
+
+        return {"response": items[-1], "thoughts": items}
+
+    @weave.op()
+    async def arun(self, user_text: str, cache: bool = False):
+        """Async twin of `run`: streams on the event loop and awaits tools."""
+        print("Input:", user_text)
+        turn_input = [{"role": "user", "content": user_text}]
+        prev_id, items = None, []
+
+        while turn_input:
+            stream = await self._athink(turn_input, prev_id, cache)
+            turn_input, calls = [], []  # collect next‑turn inputs
+
+            async for event in stream:
+                if event.type == "response.output_item.done":
+                    item = event.item
+                    if item.type == "function_call":
+                        calls.append(item)
+                    else:
+                        turn_input += self._handle_item(item)
+                    items.append(item)
 
                 if event.type == "response.completed":
                     prev_id = event.response.id
 
+            if self.parallel_tool_calls:
+                turn_input += await self._gather_tool_calls(calls)
+            else:
+                for call in calls:
+                    turn_input += await self._gather_tool_calls([call])
+
         return {"response": items[-1], "thoughts": items}
 
 
 @weave.op()
+@pure_tool
 def add(a: int, b: int) -> int:
     """Add two numbers together and return the result."""
-    return int(a) + int(b)
+    return a + b
 
 
 @weave.op()
@@ -97,15 +205,32 @@ def send_email(to: str, subject: str, body: str):
     print(f"Sending email to {to} with subject {subject} and body {body}")
 
 
+HANDMADE_INSTRUCTIONS = "You are a helpful assistant that can handle adding numbers with tool `add`. You can also call the `send_email` tool to send an email."
+
+
 @weave.op()
 def run_handmade_agent(input: str):
     tools = [add, send_email]
     agent = MiniAgent(
-        instructions="You are a helpful assistant that can handle adding numbers with tool `add`. You can also call the `send_email` tool to send an email.",
+        instructions=HANDMADE_INSTRUCTIONS,
         tools=tools,
     )
     return agent.run(input)
 
+
+@weave.op()
+async def arun_handmade_agents(inputs: list[str], max_concurrency: int = 32):
+    """Serve many conversations on one event loop, at most `max_concurrency` at once."""
+    agent = MiniAgent(instructions=HANDMADE_INSTRUCTIONS, tools=[add, send_email])
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def converse(text: str):
+        async with limit:
+            return await agent.arun(text)
+
+    return await asyncio.gather(*(converse(text) for text in inputs))
+
+
 if __name__ == "__main__":
     run_handmade_agent("What is 2 + 2?")
     run_handmade_agent("Send an email to John Doe with the subject 'Hello' and body 'How are you?'")
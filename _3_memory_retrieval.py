@@ -1,13 +1,35 @@
 import asyncio
+import atexit
+import contextvars
+import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import numpy as np
+import openai
 import weave
 from agents import Agent, FileSearchTool, Runner, function_tool, set_trace_processors
-from openai import OpenAI
 
 import config
+from client_utils import get_client
+from memory_utils import (
+    BatchingEmbedder,
+    BinaryMemoryStore,
+    EmbeddingCache,
+    GroupCommitWriter,
+    BitIndex,
+    IVFIndex,
+    KeywordIndex,
+    MemoryIndex,
+    Tombstones,
+    migrate_jsonl,
+    reciprocal_rank_fusion,
+    within_token_budget,
+)
+from utils import append_lines, recover_jsonl
 from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 set_trace_processors([WeaveTracingProcessor()])
 
@@ -16,53 +38,133 @@ MEMORY_VECTOR_FILE_ID = None
 
 weave.init(project_name=config.WEAVE_PROJECT)
 
-client = OpenAI()
+client = get_client()
 
 #-------------- Practice 1 --------------
 
-def get_vector_store_id():
-    global VECTOR_STORE_ID
-    if VECTOR_STORE_ID:
-        return VECTOR_STORE_ID
+VECTOR_STORE_FILES = ["sample_vector_store_memory.txt"]
+VECTOR_STORE_STATE_FILE = ".cache/vector_store.json"
+_VECTOR_STORE_LOCK = threading.Lock()
 
-    # Otherwise, create a new vector store
-    vector_store = client.vector_stores.create(
-        name="Agent Course",
-    )
-    client.vector_stores.files.upload_and_poll(
-        vector_store_id=vector_store.id,
-        file=open("sample_vector_store_memory.txt", "rb"),
-    )
-    print(f"Created new vector store: {vector_store.id}")
-    VECTOR_STORE_ID = vector_store.id
-    return vector_store.id
 
+def _files_digest(paths: list[str]) -> str:
+    """Content hash of the files uploaded to the vector store."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
 
-# Create search agent with just FileSearchTool
-memory_agent_1 = Agent(
-    name="Memory Manager 1",
-    instructions="Help search through files.",
-    tools=[FileSearchTool(vector_store_ids=[get_vector_store_id()])],
-    model="gpt-4.1",
-)
+
+def _saved_vector_store(digest: str) -> str | None:
+    """The persisted store id for `digest`, if it still exists on the server."""
+    if not os.path.exists(VECTOR_STORE_STATE_FILE):
+        return None
+    with open(VECTOR_STORE_STATE_FILE, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("digest") != digest:
+        return None  # the files changed since that store was built
+    try:
+        vector_store = client.vector_stores.retrieve(state["vector_store_id"])
+    except openai.NotFoundError:
+        return None
+    return None if vector_store.status == "expired" else vector_store.id
+
+
+def get_vector_store_id():
+    """
+    Id of a vector store holding VECTOR_STORE_FILES. The id is persisted in
+    VECTOR_STORE_STATE_FILE with a hash of the files, so later runs reuse the
+    store and only upload again when the files change or the store is gone.
+    """
+    global VECTOR_STORE_ID
+    with _VECTOR_STORE_LOCK:
+        if VECTOR_STORE_ID:
+            return VECTOR_STORE_ID
+
+        digest = _files_digest(VECTOR_STORE_FILES)
+        VECTOR_STORE_ID = _saved_vector_store(digest)
+        if VECTOR_STORE_ID:
+            return VECTOR_STORE_ID
+
+        # Otherwise, create a new vector store
+        vector_store = client.vector_stores.create(
+            name="Agent Course",
+        )
+        for path in VECTOR_STORE_FILES:
+            with open(path, "rb") as f:
+                client.vector_stores.files.upload_and_poll(
+                    vector_store_id=vector_store.id, file=f
+                )
+        print(f"Created new vector store: {vector_store.id}")
+        os.makedirs(os.path.dirname(VECTOR_STORE_STATE_FILE), exist_ok=True)
+        tmp = VECTOR_STORE_STATE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"digest": digest, "vector_store_id": vector_store.id}, f)
+        os.replace(tmp, VECTOR_STORE_STATE_FILE)
+        VECTOR_STORE_ID = vector_store.id
+        return vector_store.id
+
+
+_MEMORY_AGENT_1 = None
+
+
+def get_memory_agent_1() -> Agent:
+    """Search agent with just FileSearchTool, built on first use (the store may need uploading)."""
+    global _MEMORY_AGENT_1
+    if _MEMORY_AGENT_1 is None:
+        _MEMORY_AGENT_1 = Agent(
+            name="Memory Manager 1",
+            instructions="Help search through files.",
+            tools=[FileSearchTool(vector_store_ids=[get_vector_store_id()])],
+            model="gpt-4.1",
+        )
+    return _MEMORY_AGENT_1
 
 @weave.op()
 async def memory_main_1():
     question = "What was the weather during spring break?"
     print("Input:", question)
-    response = await Runner.run(memory_agent_1, question)
+    response = await Runner.run(get_memory_agent_1(), question)
     print("Output:", response.final_output)
 
 #-------------- Practice 2 --------------
 
 MEMORY_FILE = "memory_store.jsonl"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# "jsonl" keeps embeddings as JSON text in MEMORY_FILE; "binary" keeps them as
+# raw float32/float16 rows in memory_store.vectors, loaded with np.memmap.
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "jsonl")
+MEMORY_DTYPE = os.environ.get("MEMORY_DTYPE", "float32")
+# Stores at least this large are searched through an IVF index (see bench_memory.py).
+MEMORY_ANN_MIN = int(os.environ.get("MEMORY_ANN_MIN", 50_000))
+# first-pass candidate search: "ivf" (clustered) or "bits" (sign-code scan)
+MEMORY_ANN = os.environ.get("MEMORY_ANN", "ivf")
+MEMORY_ANN_FILE = "memory_store.ivf.npz"
+MEMORY_ANN_RESAVE = 10_000  # re-save the ANN file after this many new rows
+MEMORY_QUANT_FILE = "memory_store.bits.npz"
+MEMORY_TERMS_FILE = "memory_store.terms.jsonl"
+MEMORY_TOMBSTONES_FILE = "memory_store.tombstones"
+# a new memory this similar (cosine) to a stored one is treated as a duplicate
+MEMORY_DEDUP_THRESHOLD = float(os.environ.get("MEMORY_DEDUP_THRESHOLD", 0.95))
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [d.embedding for d in response.data]
+
+
+# Concurrent lookups share one API call; repeated texts are served from disk.
+embedder = BatchingEmbedder(_embed_batch, EMBEDDING_MODEL, EmbeddingCache())
+
+
 @weave.op()
 def get_embedding(text: str) -> np.ndarray:
-    return np.array(
-        client.embeddings.create(model="text-embedding-3-small", input=[text])
-        .data[0]
-        .embedding
-    )
+    return embedder.embed(text)
+
+
+@weave.op()
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    return embedder.embed_many(texts)
 
 @weave.op()
 def similarity_from_embeddings(a: np.ndarray, b: np.ndarray) -> float:
@@ -80,8 +182,7 @@ def read_file(path: str) -> list[str]:
 
 @weave.op()
 def write_file(path: str, line: str) -> None:
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    append_lines(path, [line])  # locked + fsynced, safe across processes
 
 
 @weave.op()
@@ -89,37 +190,270 @@ def load_memories() -> list[dict]:
     return [json.loads(x) for x in read_file(MEMORY_FILE)]
 
 
+_BINARY_STORE = None
+_MEMORY_INDEX = None
+# guards the three singletons; reentrant since keyword_index builds memory_index
+_MEMORY_INDEX_LOCK = threading.RLock()
+
+
+def binary_store() -> BinaryMemoryStore:
+    """The binary store, migrated once from MEMORY_FILE (recorded in its header)."""
+    global _BINARY_STORE
+    with _MEMORY_INDEX_LOCK:
+        if _BINARY_STORE is None:
+            store = BinaryMemoryStore(MEMORY_FILE.removesuffix(".jsonl"), MEMORY_DTYPE)
+            if store.migrated is None and os.path.exists(MEMORY_FILE):
+                migrated = migrate_jsonl(MEMORY_FILE, store)  # 0 if another process won
+                if migrated:
+                    print(f"Migrated {migrated} memories")
+            _BINARY_STORE = store
+        return _BINARY_STORE
+
+
+def memory_index() -> MemoryIndex:
+    """All memories as one normalized matrix, loaded from the store on first use."""
+    global _MEMORY_INDEX
+    with _MEMORY_INDEX_LOCK:
+        if _MEMORY_INDEX is None:
+            _MEMORY_INDEX = _load_memory_index()
+        return _MEMORY_INDEX
+
+
+def _load_memory_index() -> MemoryIndex:
+    if MEMORY_BACKEND == "binary":
+        index = MemoryIndex.from_store(binary_store())
+    else:
+        recover_jsonl(MEMORY_FILE)  # drop a line torn by a crash mid-append
+        index = MemoryIndex.from_records(load_memories())
+    index.delete(Tombstones(MEMORY_TOMBSTONES_FILE).rows(index.texts))
+    if len(index) >= MEMORY_ANN_MIN:
+        # training takes seconds to minutes; exact search serves until it's attached
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(_build_memory_ann, index),
+            daemon=True,
+        ).start()
+    return index
+
+
+_KEYWORD_INDEX = None
+
+
+def keyword_index() -> KeywordIndex:
+    """BM25 index over the same rows as `memory_index()`, persisted in MEMORY_TERMS_FILE."""
+    global _KEYWORD_INDEX
+    with _MEMORY_INDEX_LOCK:
+        if _KEYWORD_INDEX is None:
+            texts = memory_index().texts
+            index = KeywordIndex(MEMORY_TERMS_FILE)
+            if len(index) > len(texts):  # the store was replaced; start over
+                index.reset()
+            index.extend(texts[len(index) :])
+            index.deleted = memory_index().deleted  # share the tombstone set
+            _KEYWORD_INDEX = index
+        return _KEYWORD_INDEX
+
+
+_ANN_SAVED_SIZE = 0  # rows in the MEMORY_ANN file on disk
+
+
+def _build_memory_ann(index: MemoryIndex) -> None:
+    global _ANN_SAVED_SIZE
+    ann = memory_ann(index)
+    _ANN_SAVED_SIZE = ann.size
+    index.attach_ann(ann)  # inserts the rows saved after the file was written
+    atexit.register(save_memory_ann)
+
+
+def save_memory_ann(min_new_rows: int = 1) -> None:
+    """Persist the attached MEMORY_ANN index once it holds `min_new_rows` unsaved rows."""
+    global _ANN_SAVED_SIZE
+    ann = _MEMORY_INDEX.ann if _MEMORY_INDEX is not None else None
+    if ann is None or ann.size - _ANN_SAVED_SIZE < min_new_rows:
+        return
+    size = ann.size
+    ann.save(MEMORY_QUANT_FILE if MEMORY_ANN == "bits" else MEMORY_ANN_FILE)
+    _ANN_SAVED_SIZE = size
+
+
+def memory_ann(index: MemoryIndex) -> IVFIndex | BitIndex:
+    """The MEMORY_ANN candidate index, persisted; trained and saved on first use."""
+    if MEMORY_ANN == "bits":
+        return memory_quantized(index)
+    if os.path.exists(MEMORY_ANN_FILE):
+        ann = IVFIndex.load(MEMORY_ANN_FILE)
+        if ann.size <= len(index):  # rows added since the save are inserted on attach
+            return ann
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(index), min(len(index), 50_000), replace=False)
+    ann = IVFIndex.train(index.rows(np.sort(sample)))
+    index.attach_ann(ann)
+    ann.save(MEMORY_ANN_FILE)
+    return ann
+
+
+def memory_quantized(index: MemoryIndex) -> BitIndex:
+    """Sign codes of the rows persisted in MEMORY_QUANT_FILE, encoded on first use."""
+    if os.path.exists(MEMORY_QUANT_FILE):
+        quantized = BitIndex.load(MEMORY_QUANT_FILE)
+        if quantized.size <= len(index):  # newer rows are encoded on attach
+            return quantized
+    quantized = BitIndex(index.dim)
+    index.attach_ann(quantized)
+    quantized.save(MEMORY_QUANT_FILE)
+    return quantized
+
+
 @weave.op()
-def append_memory(memory: str) -> None:
-    write_file(
-        MEMORY_FILE,
-        json.dumps(
-            {"memory": memory.strip(), "embedding": get_embedding(memory).tolist()}
-        ),
+def append_memory(memory: str) -> bool:
+    """Store a memory; False if a near-duplicate is already stored."""
+    memory = memory.strip()
+    return _store_memories([memory], get_embedding(memory)[None, :])[0]
+
+
+@weave.op()
+def append_memories(memories: list[str]) -> int:
+    """Bulk import: one embeddings call per batch instead of one per memory."""
+    memories = [m.strip() for m in memories]
+    return sum(_store_memories(memories, get_embeddings(memories)))
+
+
+@weave.op()
+def forget_memories(query: str, threshold: float = MEMORY_DEDUP_THRESHOLD) -> int:
+    """Tombstone the memories matching `query` above `threshold`; returns how many."""
+    index = memory_index()
+    rows = [row for row, _ in index.search(get_embedding(query), threshold=threshold)]
+    Tombstones(MEMORY_TOMBSTONES_FILE).add(index.texts, rows)
+    index.delete(rows)
+    return len(rows)
+
+
+def _commit_memories(batch: list[tuple[list[str], np.ndarray]]) -> list[list[bool]]:
+    """One durable append for every save queued since the last commit."""
+    index, keywords = memory_index(), keyword_index()  # load before the store grows
+    memories = [m for batch_memories, _ in batch for m in batch_memories]
+    embeddings = np.concatenate([e for _, e in batch])
+    # checked on the writer thread, so duplicates saved concurrently are caught too
+    stored = index.novel(embeddings, MEMORY_DEDUP_THRESHOLD)
+    splits = np.cumsum([len(batch_memories) for batch_memories, _ in batch])[:-1]
+    results = [mask.tolist() for mask in np.split(stored, splits)]
+    memories = [m for m, keep in zip(memories, stored) if keep]
+    embeddings = embeddings[stored]
+    if not memories:
+        return results
+    if MEMORY_BACKEND == "binary":
+        binary_store().extend(memories, embeddings)
+    else:
+        write_file(
+            MEMORY_FILE,
+            "\n".join(
+                json.dumps({"memory": m, "embedding": e.tolist()})
+                for m, e in zip(memories, embeddings)
+            ),
+        )
+    index.extend(memories, embeddings)
+    keywords.extend(memories)
+    save_memory_ann(MEMORY_ANN_RESAVE)  # so a restart inserts fewer rows on attach
+    return results
+
+
+_MEMORY_WRITER = None
+_MEMORY_WRITER_LOCK = threading.Lock()
+
+
+def memory_writer() -> GroupCommitWriter:
+    """Single writer thread, so concurrent saves are appended in one order."""
+    global _MEMORY_WRITER
+    with _MEMORY_WRITER_LOCK:
+        if _MEMORY_WRITER is None:
+            _MEMORY_WRITER = GroupCommitWriter(_commit_memories)
+        return _MEMORY_WRITER
+
+
+def _store_memories(memories: list[str], embeddings: np.ndarray) -> list[bool]:
+    # returns once the batch holding these memories is on disk and indexed,
+    # with False for each memory skipped as a near-duplicate
+    return memory_writer().submit((memories, embeddings)).result()
+
+
+@weave.op()
+def retrieve_memories(
+    query: str,
+    k: int | None = 5,
+    threshold: float | None = None,
+    max_tokens: int | None = None,
+    time_budget_ms: int | None = None,
+) -> list[tuple[str, float]]:
+    """
+    Best-first `(memory, cosine)` pairs: at most `k`, above `threshold`, and
+    cut off once their estimated tokens would exceed `max_tokens`. With a
+    time budget, an exact scan that runs out of time ranks what it reached.
+    """
+    deadline = None
+    if time_budget_ms is not None:
+        deadline = time.monotonic() + time_budget_ms / 1000
+    query_embedding = get_embedding(query)
+    index = memory_index()
+    hits = index.search(query_embedding, k=k, threshold=threshold, deadline=deadline)
+    return within_token_budget(
+        [(index.texts[row], score) for row, score in hits], max_tokens
     )
 
 
 @weave.op()
 def relevant_memories(query: str, threshold: float = 0.5) -> list[str]:
-    q_emb = get_embedding(query)
-    return [
-        m["memory"]
-        for m in load_memories()
-        if similarity_from_embeddings(q_emb, np.array(m["embedding"])) > threshold
+    """Every memory above `threshold`, most similar first."""
+    return [m for m, _ in retrieve_memories(query, k=None, threshold=threshold)]
+
+
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="memory-search")
+
+
+@weave.op()
+def hybrid_memories(
+    query: str, top_k: int = 5, time_budget_ms: int = 1500
+) -> list[str]:
+    """
+    Keyword (BM25) and vector search run in parallel and are fused with
+    reciprocal rank fusion. A retriever still running when the time budget
+    runs out is left out of the fusion instead of delaying the answer.
+    """
+    texts, keywords = memory_index().texts, keyword_index()
+    depth = max(4 * top_k, 20)
+
+    def lexical():
+        return [row for row, _ in keywords.search(query, k=depth)]
+
+    def semantic():
+        return [row for row, _ in memory_index().search(get_embedding(query), k=depth)]
+
+    futures = [
+        _SEARCH_POOL.submit(contextvars.copy_context().run, fn)
+        for fn in (lexical, semantic)
     ]
+    done, _ = wait(futures, timeout=time_budget_ms / 1000)
+    rankings = [f.result() for f in futures if f in done]
+    return [texts[row] for row, _ in reciprocal_rank_fusion(rankings)[:top_k]]
 
 
 @function_tool
 def save_memory(memory: str) -> str:
-    append_memory(memory)
+    if not append_memory(memory):
+        return f"Already remembered: {memory.strip()}"
     return f"Memory saved: {memory.strip()}"
 
 
 @function_tool
-def query_memory(query: str) -> str:
-    hits = [
-        m["memory"] for m in load_memories() if query.lower() in m["memory"].lower()
-    ]
+def query_memory(query: str, limit: int = 10) -> str:
+    texts = memory_index().texts
+    hits = [texts[row] for row, _ in keyword_index().search(query, k=limit)]
+    return "\n".join(hits) or "No matching memories."
+
+
+@function_tool
+def search_memory(query: str, top_k: int = 5, time_budget_ms: int = 1500) -> str:
+    """Search memories by keywords and meaning at once; best matches first."""
+    hits = hybrid_memories(query, top_k, time_budget_ms)
     return "\n".join(hits) or "No matching memories."
 
 
@@ -127,7 +461,7 @@ def query_memory(query: str) -> str:
 memory_agent_2 = Agent(
     name="Memory Manager 2",
     instructions="Help users save and query their memories.",
-    tools=[save_memory, query_memory],
+    tools=[save_memory, query_memory, search_memory],
     model="gpt-4.1",
 )
 
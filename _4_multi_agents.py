@@ -1,9 +1,11 @@
 import asyncio
 
 import weave
-from agents import Agent, Runner, function_tool, set_trace_processors
+from agents import Agent, Runner, set_trace_processors
 from openai import OpenAI
 import config
+from routing_utils import PreRouter
+from travel_tools import get_faq, search_flights, search_hotels, submit_flight_claim
 
 from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 set_trace_processors([WeaveTracingProcessor()])
@@ -11,30 +13,6 @@ set_trace_processors([WeaveTracingProcessor()])
 weave.init(project_name=config.WEAVE_PROJECT)
 
 
-@function_tool
-def search_flights(origin: str, destination: str, date: str):
-    return f"Flights {origin}->{destination} on {date}: FL123, FL456"
-
-
-@function_tool
-def search_hotels(city: str, checkin: str, nights: int):
-    return f"Hotels in {city} from {checkin} for {nights} nights: Hotel Foo, Hotel Bar"
-
-
-@function_tool
-def submit_flight_claim(flight_number: str, date: str, issue: str):
-    return f"Claim submitted for {flight_number} on {date} ({issue}). Ref CLM‑0001"
-
-
-@function_tool
-def get_faq(topic: str):
-    data = {
-        "baggage": "Carry‑on 8 kg, checked 23 kg.",
-        "refund": "Refunds processed in 5‑7 days.",
-    }
-    return data.get(topic.lower(), "No FAQ available for that topic.")
-
-
 flight_booking_agent = Agent(
     name="Flight Booking Agent",
     instructions=(
@@ -118,9 +96,15 @@ triage_agent = Agent(
 )
 
 
+# Single-intent requests skip the triage (and booking router) LLM hops.
+leaf_agents = [flight_booking_agent, hotel_booking_agent, claims_agent, faq_agent]
+pre_router = PreRouter({a.name: a for a in leaf_agents}, fallback=triage_agent)
+
+
 @weave.op()
 async def run_multipleagent(prompt: str):
-    response = await Runner.run(triage_agent, prompt)
+    route = await asyncio.to_thread(pre_router.route, prompt)
+    response = await Runner.run(route.agent, prompt)
     return response.final_output
 
 
@@ -1,9 +1,12 @@
 import asyncio
+import os
+import sys
 
 import weave
 from agents import Agent, Runner, function_tool, set_trace_processors
 from openai import OpenAI
 import config
+from session_utils import SessionStore
 
 from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 set_trace_processors([WeaveTracingProcessor()])
@@ -124,19 +127,51 @@ async def run_agent(prompt: str):
     return response.final_output
 
 
+AGENTS = {
+    agent.name: agent
+    for agent in (
+        triage_agent,
+        booking_router_agent,
+        flight_booking_agent,
+        hotel_booking_agent,
+        claims_agent,
+        faq_agent,
+    )
+}
+
+# Set SESSION_DB (e.g. .cache/sessions.sqlite) to resume conversations after a restart.
+sessions = SessionStore(path=os.environ.get("SESSION_DB"))
+
+
 @weave.op()
-async def multi_agents():
-    previous_response_id = None
-    cur_agent = triage_agent
-    while True:
-        user_in = input("> ")
+async def handle_message(session_id: str, user_in: str) -> str:
+    """One turn of a conversation; many sessions can be served concurrently."""
+    async with sessions.turn_lock(session_id):
+        # SQLite reads/writes go to a thread so other sessions keep running
+        session = await asyncio.to_thread(sessions.get, session_id)
+        cur_agent, previous_response_id = triage_agent, None
+        if session is not None:
+            cur_agent = AGENTS.get(session.agent_name, triage_agent)
+            previous_response_id = session.previous_response_id
         response = await Runner.run(
             cur_agent, user_in, previous_response_id=previous_response_id
         )
-        previous_response_id = response.last_response_id
-        cur_agent = response.last_agent
-        print(f"[{cur_agent.name}] {response.final_output}")
+        await asyncio.to_thread(
+            sessions.put,
+            session_id,
+            response.last_agent.name,
+            response.last_response_id,
+        )
+    return f"[{response.last_agent.name}] {response.final_output}"
+
+
+@weave.op()
+async def multi_agents(session_id: str = "cli"):
+    while True:
+        user_in = await asyncio.to_thread(input, "> ")
+        print(await handle_message(session_id, user_in))
 
 
 if __name__ == "__main__":
-    asyncio.run(multi_agents())
+    # python _4_multi_agents_demo.py [session_id]
+    asyncio.run(multi_agents(*sys.argv[1:2]))
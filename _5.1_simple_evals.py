@@ -5,6 +5,8 @@ from agents import Agent, Runner, function_tool, set_trace_processors
 from weave import EvaluationLogger
 
 import config
+from cassette_utils import eval_run_config
+from eval_utils import EvalScheduler
 from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 set_trace_processors([WeaveTracingProcessor()])
 
@@ -65,7 +67,7 @@ def calculate_score(model_output: Any, expected: Any) -> bool:
 @weave.op()
 async def user_model(prompt: str) -> Any:
     """Model that performs arithmetic operations based on natural language prompts"""
-    result = await Runner.run(calc_agent, prompt)
+    result = await Runner.run(calc_agent, prompt, run_config=eval_run_config())
     return result.final_output
 
 
@@ -103,10 +105,16 @@ async def simple_evals():
     passed = 0
     total = len(eval_samples)
 
-    # Iterate through examples, predict, and log
-    for i, sample in enumerate(eval_samples, 1):
+    # Predict all samples concurrently (at most EVAL_CONCURRENCY at a time)
+    outputs = await EvalScheduler().map(
+        lambda sample: user_model(**sample["inputs"]),  # Pass inputs as kwargs
+        eval_samples,
+        suite="Simple Math Operations",
+    )
+
+    # Iterate through examples in order and log
+    for i, (sample, model_output) in enumerate(zip(eval_samples, outputs), 1):
         inputs = sample["inputs"]
-        model_output = await user_model(**inputs)  # Pass inputs as kwargs
         expected = sample["expected"]
         inputs["expected"] = expected  # Add expected value to inputs for logging
 
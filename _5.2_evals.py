@@ -8,18 +8,23 @@ from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 set_trace_processors([WeaveTracingProcessor()])
 
 import config
+from cassette_utils import eval_run_config
 from eval_utils import (
     CLAIMS_AGENT_TESTS,
     FAQ_AGENT_TESTS,
     FLIGHT_AGENT_TESTS,
     HOTEL_AGENT_TESTS,
     MULTI_AGENT_TESTS,
+    EvalScheduler,
     ExpectedBehavior,
     create_agents,
 )
 
 weave.init(config.WEAVE_PROJECT)
 
+# Shared by every suite: caps concurrent agent runs at EVAL_CONCURRENCY.
+scheduler = EvalScheduler()
+
 
 @weave.op()
 def evaluate_final_output(
@@ -77,15 +82,21 @@ def evaluate_step_count(min_steps: int, max_steps: int, model_output: dict) -> d
 class AgentModel(weave.Model):
     name: Optional[str] = None
     agent: Any = Field(default=None)
+    suite: Optional[str] = None
 
-    def __init__(self, agent: Agent, name: str = None):
+    def __init__(self, agent: Agent, name: str = None, suite: str = None):
         super().__init__()  # Important: call weave.Model's __init__
         self.agent = agent
         self.name = name if name else agent.name
+        self.suite = suite if suite else self.name
 
     @weave.op()
     async def predict(self, prompt: str) -> dict:
-        result = await Runner.run(self.agent, prompt)
+        async with scheduler.semaphore:
+            result = await Runner.run(
+                self.agent, prompt, run_config=eval_run_config()
+            )
+        scheduler.step(self.suite)
         return {
             "final_output": result.final_output,
             "new_items": result.new_items,
@@ -111,8 +122,9 @@ def create_evaluation_dataset(tests: List[Tuple[str, ExpectedBehavior]]) -> List
 async def evaluate_agent_with_weave(
     agent: Agent, tests: List[Tuple[str, ExpectedBehavior]], agent_name: str
 ):
-    model = AgentModel(agent)
+    model = AgentModel(agent, suite=agent_name)
     dataset = create_evaluation_dataset(tests)
+    scheduler.track(agent_name, len(dataset))
 
     # Create descriptive display names
     if agent_name.startswith("Triage_Agent_"):
@@ -143,9 +155,28 @@ async def evaluate_agent_with_weave(
     return await evaluation.evaluate(model, __weave={"display_name": display_name})
 
 
+def print_scores(results: dict) -> None:
+    for name, scores in results.items():
+        print(f"{name}:")
+        print(
+            f"  Final Output Score: {scores['evaluate_final_output']['score']['mean']:.2%}"
+        )
+        print(
+            f"  Tool Calls Score: {scores['evaluate_tool_calls']['score']['mean']:.2%}"
+        )
+        print(
+            f"  Agent Routing Score: {scores['evaluate_agent_routing']['score']['mean']:.2%}"
+        )
+        print(
+            f"  Step Count Score: {scores['evaluate_step_count']['score']['mean']:.2%}"
+        )
+
+
 @weave.op()
 async def multi_agent_evals():
-    # Test both instruction styles
+    # Every suite of both instruction styles runs at once; wall time is
+    # roughly the slowest suite, with agent runs capped by the scheduler.
+    suites, layout = {}, []
     for style in ["standard", "enhanced"]:
         (
             flight_agent,
@@ -159,64 +190,43 @@ async def multi_agent_evals():
         display_style = "Standard" if style == "standard" else "Enhanced Service"
 
         # Individual agent evaluations
-        individual_results = {
-            f"Flight Booking Agent ({display_style})": await evaluate_agent_with_weave(
+        individual = {
+            f"Flight Booking Agent ({display_style})": evaluate_agent_with_weave(
                 flight_agent, FLIGHT_AGENT_TESTS, f"Flight_Booking_Agent_{style}"
             ),
-            f"Hotel Booking Agent ({display_style})": await evaluate_agent_with_weave(
+            f"Hotel Booking Agent ({display_style})": evaluate_agent_with_weave(
                 hotel_agent, HOTEL_AGENT_TESTS, f"Hotel_Booking_Agent_{style}"
             ),
-            f"Claims Agent ({display_style})": await evaluate_agent_with_weave(
+            f"Claims Agent ({display_style})": evaluate_agent_with_weave(
                 claims_agent, CLAIMS_AGENT_TESTS, f"Claims_Agent_{style}"
             ),
-            f"FAQ Agent ({display_style})": await evaluate_agent_with_weave(
+            f"FAQ Agent ({display_style})": evaluate_agent_with_weave(
                 faq_agent, FAQ_AGENT_TESTS, f"FAQ_Agent_{style}"
             ),
         }
 
         # Multi-agent system evaluations
-        multi_agent_results = {}
-        for category, tests in MULTI_AGENT_TESTS.items():
-            multi_agent_results[f"{category} ({display_style})"] = (
-                await evaluate_agent_with_weave(
-                    triage_agent, tests, f"Triage_Agent_{category}_{style}"
-                )
+        multi_agent = {
+            f"{category} ({display_style})": evaluate_agent_with_weave(
+                triage_agent, tests, f"Triage_Agent_{category}_{style}"
             )
+            for category, tests in MULTI_AGENT_TESTS.items()
+        }
+        suites.update(individual)
+        suites.update(multi_agent)
+        layout.append((list(individual), list(multi_agent)))
+
+    results = await scheduler.run_suites(suites)
 
+    for individual, multi_agent in layout:
         # Print summary
         print("\n=== Evaluation Results ===")
 
         print("\nIndividual Agent Scores:")
-        for agent_name, results in individual_results.items():
-            print(f"{agent_name}:")
-            print(
-                f"  Final Output Score: {results['evaluate_final_output']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Tool Calls Score: {results['evaluate_tool_calls']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Agent Routing Score: {results['evaluate_agent_routing']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Step Count Score: {results['evaluate_step_count']['score']['mean']:.2%}"
-            )
+        print_scores({name: results[name] for name in individual})
 
         print("\nMulti-agent System Scores:")
-        for category, results in multi_agent_results.items():
-            print(f"{category}:")
-            print(
-                f"  Final Output Score: {results['evaluate_final_output']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Tool Calls Score: {results['evaluate_tool_calls']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Agent Routing Score: {results['evaluate_agent_routing']['score']['mean']:.2%}"
-            )
-            print(
-                f"  Step Count Score: {results['evaluate_step_count']['score']['mean']:.2%}"
-            )
+        print_scores({name: results[name] for name in multi_agent})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""
+Recall@k vs latency of approximate memory search (IVF, and a Hamming scan
+of sign bits with float32 re-ranking) against exact search.
+
+Runs on synthetic clustered embeddings, so no API key is needed:
+
+    python bench_memory.py --memories 200000 --dim 256
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from memory_utils import BitIndex, IVFIndex, MemoryIndex, normalize
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0):
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=n)
+    return normalize(
+        centres[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    )
+
+
+def timed_search(index: MemoryIndex, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    results = [[row for row, _ in index.search(q, k=k)] for q in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall(found, truth) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(
+        args.memories, args.dim, clusters=args.memories // 100
+    )
+    rng = np.random.default_rng(1)
+    picks = rng.choice(args.memories, args.queries, replace=False)
+    queries = vectors[picks] + 0.3 * rng.normal(size=(args.queries, args.dim))
+
+    index = MemoryIndex(texts=[""] * args.memories, base=vectors)
+    truth, exact_ms = timed_search(index, queries, args.k)
+    print(f"{args.memories} memories x {args.dim} dims, k={args.k}")
+    print(f"{'method':<22}{'recall@k':>10}{'ms/query':>10}")
+    print(f"{'exact':<22}{1.0:>10.3f}{exact_ms:>10.2f}")
+
+    start = time.perf_counter()
+    ivf = IVFIndex.train(vectors, nlist=args.nlist)
+    index.attach_ann(ivf)
+    build_s = time.perf_counter() - start
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        if nprobe > len(ivf.centroids):
+            break
+        ivf.nprobe = nprobe
+        found, ms = timed_search(index, queries, args.k)
+        label = f"ivf{len(ivf.centroids)} nprobe={nprobe}"
+        print(f"{label:<22}{recall(found, truth):>10.3f}{ms:>10.2f}")
+    print(f"(ivf build: {build_s:.1f}s)")
+
+    quantized = BitIndex(args.dim)
+    index.attach_ann(quantized)
+    for rerank in (10 * args.k, 50 * args.k, 100 * args.k, 400 * args.k):
+        quantized.rerank = rerank
+        found, ms = timed_search(index, queries, args.k)
+        label = f"bits rerank={rerank}"
+        print(f"{label:<22}{recall(found, truth):>10.3f}{ms:>10.2f}")
+    print(
+        f"(scan memory: float32 {vectors.nbytes / 2**20:.0f} MiB, "
+        f"bits {quantized.nbytes / 2**20:.0f} MiB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Content-addressed on-disk cache for LLM responses.
+
+Requests are keyed by a SHA-256 of their canonical JSON (model, instructions,
+input, format, ...), values are stored in SQLite and the least recently used
+entries are evicted once the cache outgrows `max_bytes`. Caching is opt-in:
+callers pass `cache=True` to the functions that use it.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseOutputItemDoneEvent,
+)
+
+DEFAULT_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", ".cache/responses.sqlite")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def request_key(**request: Any) -> str:
+    """Stable hash of a full request; any change in any field is a new key."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed key/value store with size-based LRU eviction and hit/miss counters."""
+
+    def __init__(
+        self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path, self.max_bytes = path, max_bytes
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)"
+        )
+        self._bytes = self._total_bytes()  # running total, kept in step by put/_evict
+
+    def _total_bytes(self) -> int:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return total
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        # other processes may share the file: resync before deleting anything
+        total = self._bytes = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        # free down to 90% so eviction doesn't run on every subsequent put
+        target = total - int(self.max_bytes * 0.9)
+        doomed, freed = [], 0
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            doomed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._bytes -= freed
+
+    def get_or_compute(
+        self, request: Dict[str, Any], compute: Callable[[], str]
+    ) -> str:
+        key = request_key(**request)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": size,
+            }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """The process-wide cache at `RESPONSE_CACHE_PATH` (default `.cache/responses.sqlite`)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def cached_call(
+    request: Dict[str, Any], compute: Callable[[], str], cache: bool
+) -> str:
+    """Run `compute` for `request`, going through the default cache when `cache` is set."""
+    return get_response_cache().get_or_compute(request, compute) if cache else compute()
+
+
+# ── streamed responses ───────────────────────────────────────────
+# A streamed response is cached as its final `Response`; replays re-emit the
+# two event types MiniAgent consumes (output_item.done and completed).
+def _replay_events(payload: str):
+    response = Response.model_validate_json(payload)
+    for i, item in enumerate(response.output):
+        yield ResponseOutputItemDoneEvent.model_construct(
+            type="response.output_item.done",
+            item=item,
+            output_index=i,
+            sequence_number=i,
+        )
+    yield ResponseCompletedEvent.model_construct(
+        type="response.completed",
+        response=response,
+        sequence_number=len(response.output),
+    )
+
+
+def cached_stream(request: Dict[str, Any], create: Callable[[], Any]):
+    """Sync event stream for `request`, replayed from the cache when possible."""
+    cache, key = get_response_cache(), request_key(**request)
+    payload = cache.get(key)
+    if payload is not None:
+        yield from _replay_events(payload)
+        return
+    for event in create():
+        if event.type == "response.completed":
+            cache.put(key, event.response.model_dump_json())
+        yield event
+
+
+async def acached_stream(request: Dict[str, Any], create: Callable[[], Any]):
+    """Async twin of `cached_stream`; `create` returns an awaitable stream."""
+    # SQLite calls run in a thread so other conversations on the loop keep going
+    cache = await asyncio.to_thread(get_response_cache)
+    key = request_key(**request)
+    payload = await asyncio.to_thread(cache.get, key)
+    if payload is not None:
+        for event in _replay_events(payload):
+            yield event
+        return
+    async for event in await create():
+        if event.type == "response.completed":
+            await asyncio.to_thread(cache.put, key, event.response.model_dump_json())
+        yield event
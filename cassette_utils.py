@@ -0,0 +1,257 @@
+"""
+Record/replay cassettes for Agents SDK runs, so evals can be re-scored
+without calling the model.
+
+`CassetteProvider` is a `ModelProvider` whose models answer from a local
+JSONL cassette. Every model call is keyed by a hash of what the model sees
+(model name, instructions, input items, tools, handoffs, settings), and the
+recorded `ModelResponse` is served back instead of calling the Responses
+API. Tools and handoffs still run locally, so a replayed run produces the
+same `new_items` as the recorded one.
+
+Streamed runs (`Runner.run_streamed`) call live in record/auto mode and record
+their final response, so they can be replayed by a non-streamed run; replay
+mode cannot re-stream and raises CassetteMiss for them.
+
+Modes (`EVAL_CASSETTE_MODE`, cassette path in `EVAL_CASSETTE`):
+    off     live calls, nothing recorded (default)
+    record  live calls, every response appended to the cassette
+    replay  cassette only; a request that was never recorded raises CassetteMiss
+    auto    replay when recorded, otherwise call live and record
+"""
+
+import json
+import os
+import threading
+from typing import AsyncIterator, Dict, Optional
+
+from agents import Model, ModelProvider, OpenAIProvider, RunConfig, Usage
+from agents.items import ModelResponse, TResponseStreamEvent
+from openai.types.responses import Response, ResponseCompletedEvent
+from pydantic import TypeAdapter
+from pydantic_core import to_jsonable_python
+
+from cache_utils import request_key
+from utils import append_lines, recover_jsonl
+
+MODES = ("off", "record", "replay", "auto")
+DEFAULT_CASSETTE_PATH = ".cache/eval_cassette.jsonl"
+
+_RESPONSE = TypeAdapter(ModelResponse)
+
+
+class CassetteMiss(KeyError):
+    """Replay mode met a request that is not in the cassette."""
+
+
+def _model_response(response: Response) -> ModelResponse:
+    """The `ModelResponse` Runner builds from a streamed run's final event."""
+    usage = response.usage
+    return ModelResponse(
+        output=response.output,
+        usage=(
+            Usage(
+                requests=1,
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                total_tokens=usage.total_tokens,
+                input_tokens_details=usage.input_tokens_details,
+                output_tokens_details=usage.output_tokens_details,
+            )
+            if usage
+            else Usage()
+        ),
+        response_id=response.id,
+    )
+
+
+class Cassette:
+    """Append-only JSONL map of request key -> recorded `ModelResponse`."""
+
+    def __init__(self, path: str = DEFAULT_CASSETTE_PATH):
+        self.path = path
+        self.hits = self.misses = self.recorded = 0
+        self._responses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            recover_jsonl(path)
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[entry["key"]] = entry["response"]
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        with self._lock:
+            payload = self._responses.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _RESPONSE.validate_json(payload)
+
+    def put(self, key: str, response: ModelResponse) -> None:
+        payload = _RESPONSE.dump_json(response).decode("utf-8")
+        with self._lock:
+            if key in self._responses:
+                return
+            self._responses[key] = payload
+            self.recorded += 1
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            append_lines(self.path, [json.dumps({"key": key, "response": payload})])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._responses),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+class CassetteModel(Model):
+    """Serves `get_response` from the cassette, falling back to `live` as the mode allows;
+    `stream_response` always streams live and records the final response."""
+
+    def __init__(
+        self, model_name: str, live: Optional[Model], cassette: Cassette, mode: str
+    ):
+        self.model_name, self.live = model_name, live
+        self.cassette, self.mode = cassette, mode
+
+    def _key(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs
+    ):
+        return request_key(
+            model=self.model_name,
+            instructions=system_instructions,
+            input=to_jsonable_python(input, fallback=str),
+            tools=[tool.name for tool in tools],
+            handoffs=[handoff.tool_name for handoff in handoffs],
+            output_schema=output_schema.name() if output_schema else None,
+            settings=to_jsonable_python(model_settings, fallback=str),
+        )
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id,
+        prompt=None,
+    ) -> ModelResponse:
+        key = self._key(
+            system_instructions, input, model_settings, tools, output_schema, handoffs
+        )
+        if self.mode in ("replay", "auto"):
+            response = self.cassette.get(key)
+            if response is not None:
+                return response
+            if self.mode == "replay":
+                raise CassetteMiss(
+                    f"no recorded response for this {self.model_name} request "
+                    f"in {self.cassette.path}; record it with EVAL_CASSETTE_MODE=record"
+                )
+        response = await self.live.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        )
+        self.cassette.put(key, response)
+        return response
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id,
+        prompt=None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        if self.mode == "replay":
+            raise CassetteMiss(
+                f"cannot replay a streamed {self.model_name} run from "
+                f"{self.cassette.path}; use Runner.run or EVAL_CASSETTE_MODE=auto"
+            )
+        key = self._key(
+            system_instructions, input, model_settings, tools, output_schema, handoffs
+        )
+        async for event in self.live.stream_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        ):
+            if isinstance(event, ResponseCompletedEvent):
+                self.cassette.put(key, _model_response(event.response))
+            yield event
+
+
+class CassetteProvider(ModelProvider):
+    """Model provider that wraps `live` (OpenAI by default) with a cassette."""
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        mode: str = "replay",
+        live: Optional[ModelProvider] = None,
+    ):
+        if mode not in MODES or mode == "off":
+            raise ValueError(f"cassette mode must be one of {MODES[1:]}, got {mode!r}")
+        self.cassette, self.mode = cassette, mode
+        self._live = live
+        self._models: Dict[Optional[str], CassetteModel] = {}
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        model = self._models.get(model_name)
+        if model is None:
+            live = None
+            if self.mode != "replay":  # replay must work without an API key
+                self._live = self._live or OpenAIProvider()
+                live = self._live.get_model(model_name)
+            model = self._models[model_name] = CassetteModel(
+                model_name or "default", live, self.cassette, self.mode
+            )
+        return model
+
+
+_provider: Optional[CassetteProvider] = None
+_provider_lock = threading.Lock()
+
+
+def eval_run_config() -> RunConfig:
+    """RunConfig for eval runs, going through the cassette set up by the environment."""
+    global _provider
+    mode = os.environ.get("EVAL_CASSETTE_MODE", "off")
+    if mode == "off":
+        return RunConfig()
+    with _provider_lock:
+        if _provider is None:
+            path = os.environ.get("EVAL_CASSETTE", DEFAULT_CASSETTE_PATH)
+            _provider = CassetteProvider(Cassette(path), mode)
+    return RunConfig(model_provider=_provider)
@@ -0,0 +1,120 @@
+"""
+Process-wide OpenAI clients that share pooled, keep-alive HTTP connections.
+
+Every module asks `get_client()` / `get_async_client()` instead of building its
+own `OpenAI()`, so TLS and connection setup is paid once per process and the
+pool is reused by all agents. `connection_stats()` counts how many requests
+went out on a fresh connection versus a reused one.
+"""
+
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import Dict
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0  # seconds an idle connection is kept open
+    timeout: float = 600.0
+    connect_timeout: float = 10.0
+
+
+_config = PoolConfig()
+_lock = threading.Lock()
+_sync_client: OpenAI | None = None
+# httpx async pools are bound to the loop they first ran on, so keep one per loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+_stats = {"requests": 0, "new_connections": 0}
+
+
+def configure(**overrides) -> PoolConfig:
+    """Change pool settings; clients created after this call pick them up."""
+    global _config, _sync_client
+    with _lock:
+        _config = replace(_config, **overrides)
+        _sync_client = None
+        _async_clients.clear()
+    return _config
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+# ── connection accounting ────────────────────────────────────────
+# httpcore reports a "connect_tcp" trace event only when it opens a new
+# connection; every other request was served from the keep-alive pool.
+def _on_trace(event: str, info: dict) -> None:
+    if event == "connection.connect_tcp.complete":
+        _count("new_connections")
+
+
+async def _on_atrace(event: str, info: dict) -> None:
+    _on_trace(event, info)
+
+
+def _trace_request(request: httpx.Request) -> None:
+    _count("requests")
+    request.extensions["trace"] = _on_trace
+
+
+async def _atrace_request(request: httpx.Request) -> None:
+    _count("requests")
+    request.extensions["trace"] = _on_atrace
+
+
+def connection_stats() -> Dict[str, int]:
+    with _lock:
+        requests, new = _stats["requests"], _stats["new_connections"]
+    return {
+        "requests": requests,
+        "new_connections": new,
+        "reused_connections": max(requests - new, 0),
+    }
+
+
+# ── client registry ──────────────────────────────────────────────
+def _http_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=_config.max_connections,
+            max_keepalive_connections=_config.max_keepalive_connections,
+            keepalive_expiry=_config.keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(_config.timeout, connect=_config.connect_timeout),
+    }
+
+
+def get_client() -> OpenAI:
+    """Return the shared synchronous client, creating it on first use."""
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            http_client = DefaultHttpxClient(
+                **_http_options(), event_hooks={"request": [_trace_request]}
+            )
+            _sync_client = OpenAI(http_client=http_client)
+        return _sync_client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the shared async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            http_client = DefaultAsyncHttpxClient(
+                **_http_options(), event_hooks={"request": [_atrace_request]}
+            )
+            client = _async_clients[loop] = AsyncOpenAI(http_client=http_client)
+        return client
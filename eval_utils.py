@@ -1,5 +1,9 @@
+import asyncio
+import os
+import threading
+import time
 from dataclasses import dataclass
-from typing import Callable, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
 
 @dataclass
@@ -420,92 +424,124 @@ AGENT_INSTRUCTIONS = {
 }
 
 
-def create_agents(instruction_style="standard"):
+@dataclass(frozen=True)
+class AgentSpec:
+    name: str
+    tools: Tuple[str, ...] = ()
+    handoffs: Tuple[str, ...] = ()  # keys of other AGENT_GRAPH entries
+
+
+# Declarative agent graph; instructions come from AGENT_INSTRUCTIONS[key][variant].
+AGENT_GRAPH = {
+    "flight": AgentSpec("Flight Booking Agent", tools=("search_flights",)),
+    "hotel": AgentSpec("Hotel Booking Agent", tools=("search_hotels",)),
+    "claims": AgentSpec("Claims Agent", tools=("submit_flight_claim",)),
+    "faq": AgentSpec("FAQ Agent", tools=("get_faq",)),
+    "booking_router": AgentSpec("Booking Router Agent", handoffs=("flight", "hotel")),
+    "triage": AgentSpec("Triage Agent", handoffs=("booking_router", "claims", "faq")),
+}
+
+# Instruction variant per agent for each style; agents not listed use "standard".
+INSTRUCTION_STYLES = {
+    "standard": {},
+    "enhanced": {
+        "flight": "concierge",
+        "hotel": "luxury",
+        "claims": "empathetic",
+        "faq": "educational",
+    },
+}
+
+_AGENT_CACHE: Dict[tuple, Any] = {}
+_AGENT_CACHE_LOCK = threading.Lock()
+
+
+def build_agent(key: str, variants: Dict[str, str], model: str):
+    """
+    Build AGENT_GRAPH[key] and its handoffs, memoized on everything that
+    shapes an agent (instructions, model, tools, handoff agents), so graph
+    variants share every sub-agent they don't change.
+    """
+    from agents import Agent
+
+    from travel_tools import TOOLS
+
+    spec = AGENT_GRAPH[key]
+    handoffs = [build_agent(child, variants, model) for child in spec.handoffs]
+    variant = variants.get(key, "standard")
+    cache_key = (key, variant, model, tuple(id(agent) for agent in handoffs))
+    with _AGENT_CACHE_LOCK:
+        agent = _AGENT_CACHE.get(cache_key)
+        if agent is None:
+            agent = _AGENT_CACHE[cache_key] = Agent(
+                name=spec.name,
+                instructions=AGENT_INSTRUCTIONS[key][variant],
+                tools=[TOOLS[tool] for tool in spec.tools],
+                handoffs=handoffs,
+                model=model,
+            )
+        return agent
+
+
+def create_agents(instruction_style="standard", model="gpt-4o-mini"):
     """
     Create all agents with specified instruction style.
     Args:
-        instruction_style: Either "standard" or "enhanced" ("enhanced" uses concierge/luxury/empathetic/educational variants)
+        instruction_style: A key of INSTRUCTION_STYLES ("enhanced" uses concierge/luxury/empathetic/educational variants)
+        model: Model used by every agent
     Returns:
         Tuple containing all agents in order: (flight, hotel, claims, faq, booking_router, triage)
+    Agents are cached, so repeated calls return the same objects.
     """
-    from agents import Agent
-
-    from _4_multi_agents import (
-        get_faq,
-        search_flights,
-        search_hotels,
-        submit_flight_claim,
+    variants = INSTRUCTION_STYLES[instruction_style]
+    return tuple(
+        build_agent(key, variants, model)
+        for key in ("flight", "hotel", "claims", "faq", "booking_router", "triage")
     )
 
-    # For booking_router and triage, always use standard as they don't have variants
-    style = (
-        "standard"
-        if instruction_style == "standard"
-        else {
-            "flight": "concierge",
-            "hotel": "luxury",
-            "claims": "empathetic",
-            "faq": "educational",
-        }
-    )
 
-    # Create base agents
-    flight_agent = Agent(
-        name="Flight Booking Agent",
-        instructions=AGENT_INSTRUCTIONS["flight"][
-            style if isinstance(style, str) else style["flight"]
-        ],
-        tools=[search_flights],
-        model="gpt-4o-mini",
-    )
+class EvalScheduler:
+    """
+    Runs eval suites and samples concurrently. Every model call, in any
+    suite, takes a slot of one global semaphore (`EVAL_CONCURRENCY`, default
+    8) to stay under API rate limits; progress is printed per suite.
+    """
 
-    hotel_agent = Agent(
-        name="Hotel Booking Agent",
-        instructions=AGENT_INSTRUCTIONS["hotel"][
-            style if isinstance(style, str) else style["hotel"]
-        ],
-        tools=[search_hotels],
-        model="gpt-4o-mini",
-    )
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = concurrency or int(os.environ.get("EVAL_CONCURRENCY", 8))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self._progress: Dict[str, List[int]] = {}
 
-    claims_agent = Agent(
-        name="Claims Agent",
-        instructions=AGENT_INSTRUCTIONS["claims"][
-            style if isinstance(style, str) else style["claims"]
-        ],
-        tools=[submit_flight_claim],
-        model="gpt-4o-mini",
-    )
+    def track(self, suite: str, total: int) -> None:
+        self._progress[suite] = [0, total]
 
-    faq_agent = Agent(
-        name="FAQ Agent",
-        instructions=AGENT_INSTRUCTIONS["faq"][
-            style if isinstance(style, str) else style["faq"]
-        ],
-        tools=[get_faq],
-        model="gpt-4o-mini",
-    )
+    def step(self, suite: str) -> None:
+        progress = self._progress.setdefault(suite, [0, 0])
+        progress[0] += 1
+        print(f"[{suite}] {progress[0]}/{progress[1] or '?'}")
 
-    # Create routing agents
-    booking_router_agent = Agent(
-        name="Booking Router Agent",
-        instructions=AGENT_INSTRUCTIONS["booking_router"]["standard"],
-        handoffs=[flight_agent, hotel_agent],
-        model="gpt-4o-mini",
-    )
+    async def run_suites(self, suites: Dict[str, Awaitable]) -> Dict[str, Any]:
+        """Await all suites at once; results keep the order of `suites`."""
 
-    triage_agent = Agent(
-        name="Triage Agent",
-        instructions=AGENT_INSTRUCTIONS["triage"]["standard"],
-        handoffs=[booking_router_agent, claims_agent, faq_agent],
-        model="gpt-4o-mini",
-    )
+        async def timed(name: str, suite: Awaitable):
+            start = time.perf_counter()
+            result = await suite
+            print(f"[{name}] done in {time.perf_counter() - start:.1f}s")
+            return result
 
-    return (
-        flight_agent,
-        hotel_agent,
-        claims_agent,
-        faq_agent,
-        booking_router_agent,
-        triage_agent,
-    )
+        results = await asyncio.gather(*(timed(n, s) for n, s in suites.items()))
+        return dict(zip(suites, results))
+
+    async def map(
+        self, fn: Callable[[Any], Awaitable], items: Sequence, suite: str
+    ) -> List:
+        """`fn` over `items` concurrently, one semaphore slot each; results in input order."""
+        self.track(suite, len(items))
+
+        async def one(item):
+            async with self.semaphore:
+                result = await fn(item)
+            self.step(suite)
+            return result
+
+        return await asyncio.gather(*(one(item) for item in items))
@@ -0,0 +1,1027 @@
+"""
+Data structures behind the memory chapter (_3_memory_retrieval.py).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from utils import append_lines, estimate_tokens, file_lock, recover_jsonl
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix as float32 (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def top_k(scores: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """Indices of the `k` highest scores, best first (all of them when k is None)."""
+    if k is not None and k < len(scores):
+        idx = np.argpartition(-scores, k)[:k]
+        return idx[np.argsort(-scores[idx], kind="stable")]
+    return np.argsort(-scores, kind="stable")
+
+
+def _matvec(matrix: np.ndarray, vector: np.ndarray, block: int = 1 << 16) -> np.ndarray:
+    """`matrix @ vector` in row blocks, upcasting non-float32 (e.g. float16) blocks."""
+    if matrix.dtype == np.float32:
+        return matrix @ vector
+    out = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), block):
+        rows = np.asarray(matrix[start : start + block], dtype=np.float32)
+        out[start : start + len(rows)] = rows @ vector
+    return out
+
+
+# ── embeddings ───────────────────────────────────────────────────
+class EmbeddingCache:
+    """Persistent `hash(model, text) -> float32 vector` map in SQLite."""
+
+    def __init__(self, path: str = ".cache/embeddings.sqlite"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under SQLite's variable limit
+                chunk = keys[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, blob in self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+                ):
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [
+                    (key, np.asarray(v, dtype=np.float32).tobytes())
+                    for key, v in items.items()
+                ],
+            )
+
+
+class BatchingEmbedder:
+    """
+    Coalesces embedding requests. `embed` calls from concurrent threads that
+    arrive within `window` seconds share one API call of at most `max_batch`
+    inputs / ~`max_tokens` tokens, and texts already in `cache` never reach the
+    API. `embed_batch` maps a list of texts to a list of vectors.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        model: str,
+        cache: Optional[EmbeddingCache] = None,
+        max_batch: int = 2048,
+        max_tokens: int = 250_000,
+        window: float = 0.005,
+    ):
+        self.embed_batch, self.model, self.cache = embed_batch, model, cache
+        self.max_batch, self.max_tokens, self.window = max_batch, max_tokens, window
+        self.api_calls = 0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _batches(self, texts: Sequence[str]) -> Iterator[List[str]]:
+        batch, tokens = [], 0
+        for text in texts:
+            size = estimate_tokens(text)
+            if batch and (
+                len(batch) == self.max_batch or tokens + size > self.max_tokens
+            ):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += size
+        if batch:
+            yield batch
+
+    def _fetch(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Vectors for unique `texts`: cache first, then batched API calls."""
+        keys = {text: EmbeddingCache.key(self.model, text) for text in texts}
+        cached = self.cache.get_many(list(keys.values())) if self.cache else {}
+        vectors = {t: cached[k] for t, k in keys.items() if k in cached}
+        missing = [t for t in keys if t not in vectors]
+        for batch in self._batches(missing):
+            self.api_calls += 1
+            embeddings = np.asarray(self.embed_batch(batch), dtype=np.float32)
+            if len(embeddings) != len(batch):
+                raise ValueError(
+                    f"got {len(embeddings)} embeddings for {len(batch)} inputs"
+                )
+            fresh = dict(zip(batch, embeddings))
+            if self.cache:
+                self.cache.put_many({keys[t]: v for t, v in fresh.items()})
+            vectors.update(fresh)
+        return vectors
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a bulk list in as few API calls as the limits allow."""
+        vectors = self._fetch(list(dict.fromkeys(texts)))
+        return np.array([vectors[t] for t in texts], dtype=np.float32)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text, sharing an API call with concurrent callers."""
+        future: Future = Future()
+        self._queue.put((text, future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+        return future.result()
+
+    def _drain(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(pending) < self.max_batch:
+                try:
+                    pending.append(
+                        self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    )
+                except queue.Empty:
+                    break
+            # nothing may escape: this thread is never restarted, and a dead
+            # worker would leave every later embed() waiting forever
+            texts = list(dict.fromkeys(t for t, _ in pending))
+            vectors, error = {}, None
+            try:
+                vectors = self._fetch(texts)
+            except Exception as exc:  # hand the failure to every waiting caller
+                error = exc
+            for text, future in pending:
+                if text in vectors:
+                    future.set_result(vectors[text])
+                else:
+                    future.set_exception(
+                        error or KeyError(f"no embedding returned for {text!r}")
+                    )
+
+
+# ── vector index ─────────────────────────────────────────────────
+class MemoryIndex:
+    """
+    Memories with pre-normalized embeddings, so a query is one matrix-vector
+    product. Rows live in an optional read-only `base` matrix (e.g. the memmap
+    of a `BinaryMemoryStore`) followed by an in-memory float32 tail that new
+    memories are appended to in place (capacity doubles when full).
+    """
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        texts: Sequence[str] = (),
+        base: Optional[np.ndarray] = None,
+    ):
+        if base is None:
+            base = np.empty((0, dim or 0), dtype=np.float32)
+        if len(base) != len(texts):
+            raise ValueError(f"{len(texts)} texts for {len(base)} embeddings")
+        self.texts: List[str] = list(texts)
+        self._base = base
+        self._tail = np.empty((0, base.shape[1]), dtype=np.float32)
+        self._tail_size = 0
+        self._lock = threading.Lock()
+        # optional candidate search (IVFIndex or BitIndex), rescored exactly
+        self.ann: Optional[Union["IVFIndex", "BitIndex"]] = None
+        self.deleted: Set[int] = set()  # tombstoned rows, skipped by search
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "MemoryIndex":
+        """Build from `{"memory": ..., "embedding": [...]}` records."""
+        records = list(records)
+        index = cls()
+        if records:
+            index.extend(
+                [r["memory"] for r in records],
+                np.array([r["embedding"] for r in records], dtype=np.float32),
+            )
+        return index
+
+    @classmethod
+    def from_store(cls, store: "BinaryMemoryStore") -> "MemoryIndex":
+        """Index a binary store without copying it: its memmap becomes the base."""
+        texts, matrix = store.load()
+        return cls(texts=texts, base=matrix)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def dim(self) -> int:
+        return self._base.shape[1]
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        if dim != self.dim:
+            if self.texts:
+                raise ValueError(f"embedding has {dim} dims, index has {self.dim}")
+            self._base = np.empty((0, dim), dtype=np.float32)
+            self._tail = np.empty((0, dim), dtype=np.float32)
+        size, capacity = self._tail_size, self._tail.shape[0]
+        if size + rows > capacity:
+            grown = np.empty(
+                (max(size + rows, 2 * capacity, 16), dim), dtype=np.float32
+            )
+            if size:
+                grown[:size] = self._tail[:size]
+            self._tail = grown
+
+    def extend(self, texts: Sequence[str], embeddings: np.ndarray) -> None:
+        embeddings = normalize(np.atleast_2d(embeddings))
+        with self._lock:
+            self._reserve(len(texts), embeddings.shape[1])
+            first, size = len(self.texts), self._tail_size
+            self._tail[size : size + len(texts)] = embeddings
+            self.texts.extend(texts)
+            self._tail_size += len(texts)  # publish the rows last
+            if self.ann is not None:
+                self.ann.add(np.arange(first, first + len(texts)), embeddings)
+
+    def attach_ann(
+        self, ann: Union["IVFIndex", "BitIndex"], block: int = 1 << 16
+    ) -> None:
+        """Search through `ann` from now on, first inserting rows it hasn't seen."""
+        with self._lock:
+            for start in range(ann.size, len(self.texts), block):
+                ids = np.arange(start, min(start + block, len(self.texts)))
+                ann.add(ids, self.rows(ids))
+            self.ann = ann
+
+    def add(self, text: str, embedding: np.ndarray) -> None:
+        self.extend([text], embedding)
+
+    def delete(self, rows: Iterable[int]) -> None:
+        """Hide rows from search; they stay stored until the store is compacted."""
+        with self._lock:
+            self.deleted.update(rows)
+
+    def novel(self, embeddings: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        Mask of the `embeddings` that have no live row, nor an earlier
+        embedding in the same batch, with cosine above `threshold`.
+        """
+        embeddings = normalize(np.atleast_2d(embeddings))
+        keep = np.ones(len(embeddings), dtype=bool)
+        for i, embedding in enumerate(embeddings):
+            earlier = embeddings[:i][keep[:i]]
+            if (earlier @ embedding > threshold).any() or self.search(
+                embedding, k=1, threshold=threshold
+            ):
+                keep[i] = False
+        return keep
+
+    def rows(self, ids: Sequence[int]) -> np.ndarray:
+        """Normalized float32 embeddings of the given rows."""
+        ids = np.asarray(ids, dtype=np.int64)
+        n_base = len(self._base)
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_base = ids < n_base
+        out[in_base] = self._base[ids[in_base]]
+        out[~in_base] = self._tail[ids[~in_base] - n_base]
+        return out
+
+    def scores(
+        self, query: np.ndarray, deadline: Optional[float] = None, block: int = 1 << 16
+    ) -> np.ndarray:
+        """
+        Cosine similarity of `query` with every row. With a `deadline`
+        (a `time.monotonic()` value) the scan goes block by block and stops
+        once it passes, returning scores for the rows scanned so far.
+        """
+        query = normalize(query)
+        tail = self._tail[: self._tail_size]
+        if deadline is None:
+            if not len(self._base):
+                return tail @ query
+            return np.concatenate([_matvec(self._base, query), tail @ query])
+        parts = []
+        for matrix in (self._base, tail):
+            for start in range(0, len(matrix), block):
+                if parts and time.monotonic() >= deadline:
+                    return np.concatenate(parts)
+                parts.append(_matvec(matrix[start : start + block], query))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: Optional[int] = None,
+        threshold: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        `(row, cosine)` pairs, best first, optionally capped at `k` and above
+        `threshold`. An exact scan that runs into `deadline` ranks only the
+        rows it reached (see `scores`).
+        """
+        if not self.texts:
+            return []
+        if self.ann is None:
+            candidates, scores = None, self.scores(query, deadline)
+        else:  # exact cosine, but only over the rows the ANN index proposes
+            candidates = self.ann.candidates(query)
+            scores = self.rows(candidates) @ normalize(query)
+        with self._lock:  # delete() may be updating the set
+            deleted = list(self.deleted)
+        if deleted:
+            ids = np.arange(len(scores)) if candidates is None else candidates
+            scores[np.isin(ids, deleted)] = -np.inf
+        best = top_k(scores, k)
+        best = best[scores[best] > (-np.inf if threshold is None else threshold)]
+        rows = best if candidates is None else candidates[best]
+        return [(int(r), float(s)) for r, s in zip(rows, scores[best])]
+
+
+def within_token_budget(
+    hits: Sequence[Tuple[str, float]], max_tokens: Optional[int]
+) -> List[Tuple[str, float]]:
+    """Longest best-first prefix of `(text, score)` hits whose estimated tokens fit."""
+    if max_tokens is None:
+        return list(hits)
+    kept, used = [], 0
+    for text, score in hits:
+        used += estimate_tokens(text)
+        if used > max_tokens:
+            break
+        kept.append((text, score))
+    return kept
+
+
+# ── approximate nearest neighbours ───────────────────────────────
+class IVFIndex:
+    """
+    Inverted-file ANN index over normalized vectors. Spherical k-means puts
+    `nlist` centroids over the data and every row id is filed under its
+    closest centroid; a query scans only the ids of its `nprobe` closest
+    lists, i.e. roughly `nprobe / nlist` of the store.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = normalize(centroids)
+        self.nprobe = nprobe
+        self._lists = [array("q") for _ in range(len(self.centroids))]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        iterations: int = 10,
+        sample: int = 50_000,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Fit centroids on (a sample of) `vectors`; ids still have to be `add`ed."""
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample:
+            vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+        data = normalize(vectors)
+        nlist = min(nlist or max(1, int(4 * np.sqrt(len(data)))), len(data))
+        centroids = data[rng.choice(len(data), nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0  # re-seed clusters that lost all their points
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+            centroids = normalize(sums)
+        return cls(centroids, nprobe)
+
+    @property
+    def size(self) -> int:
+        return sum(len(ids) for ids in self._lists)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        assign = np.argmax(normalize(np.atleast_2d(vectors)) @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        ids = np.asarray(ids, dtype=np.int64)[order]
+        with self._lock:
+            for c in np.flatnonzero(np.diff(bounds)):
+                self._lists[c].extend(ids[bounds[c] : bounds[c + 1]].tolist())
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        probe = top_k(self.centroids @ normalize(query), nprobe or self.nprobe)
+        with self._lock:
+            lists = [np.frombuffer(self._lists[c], dtype=np.int64) for c in probe]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            lengths = [len(ids) for ids in self._lists]
+            ids = np.concatenate(
+                [np.frombuffer(ids, dtype=np.int64) for ids in self._lists]
+            )
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp, centroids=self.centroids, lengths=lengths, ids=ids, nprobe=self.nprobe
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(data["centroids"], int(data["nprobe"]))
+            all_ids = data["ids"]
+            offsets = np.concatenate([[0], np.cumsum(data["lengths"])])
+        for c, ids in enumerate(index._lists):
+            ids.frombytes(all_ids[offsets[c] : offsets[c + 1]].tobytes())
+        return index
+
+
+class BitIndex:
+    """
+    Binary-quantized copy of the rows: one sign bit per dimension, packed
+    into uint64 words (1/32 of the float32 size). A query ranks rows by
+    Hamming distance between sign codes (`np.bitwise_count`, no float
+    upcast) and proposes its `rerank` nearest, which `MemoryIndex.search`
+    rescores exactly in float32. Memory is only saved when the float32 rows
+    are memmapped (MEMORY_BACKEND=binary); sign bits are coarse, so measure
+    recall against `rerank` with bench_memory.py.
+    """
+
+    def __init__(self, dim: int, rerank: int = 1000):
+        self.dim, self.rerank = dim, rerank
+        self._codes = np.empty((0, self.words(dim)), dtype=np.uint64)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def words(dim: int) -> int:
+        return -(-dim // 64)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Sign bits of each row, zero-padded to whole uint64 words."""
+        bits = np.packbits(np.atleast_2d(vectors) > 0, axis=1)
+        pad = self.words(self.dim) * 8 - bits.shape[1]
+        return np.pad(bits, ((0, 0), (0, pad))).view(np.uint64)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self._size * self._codes.shape[1] * 8
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Append rows; ids must continue the index (rows are stored by position)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        codes = self.encode(vectors)
+        with self._lock:
+            size = self._size
+            if len(ids) and (ids[0] != size or ids[-1] != size + len(ids) - 1):
+                raise ValueError(f"rows {ids[0]}.. do not continue at row {size}")
+            if size + len(ids) > len(self._codes):
+                capacity = max(size + len(ids), 2 * len(self._codes), 16)
+                grown = np.empty((capacity, codes.shape[1]), dtype=np.uint64)
+                grown[:size] = self._codes[:size]
+                self._codes = grown
+            self._codes[size : size + len(ids)] = codes
+            self._size += len(ids)
+
+    def candidates(self, query: np.ndarray, rerank: Optional[int] = None) -> np.ndarray:
+        size = self._size
+        distances = np.bitwise_count(self._codes[:size] ^ self.encode(query)).sum(
+            axis=1, dtype=np.int32
+        )
+        return top_k(-distances, rerank or self.rerank).astype(np.int64)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            codes = self._codes[: self._size]
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, codes=codes, dim=self.dim, rerank=self.rerank)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BitIndex":
+        with np.load(path) as data:
+            index = cls(int(data["dim"]), int(data["rerank"]))
+            index._codes = data["codes"]
+        index._size = len(index._codes)
+        return index
+
+
+# ── keyword index ────────────────────────────────────────────────
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class KeywordIndex:
+    """
+    Inverted index with BM25 ranking. Postings map each term to `{row: term
+    frequency}`, so adding a memory touches only its own terms and a query
+    only visits the postings of its terms. With `path`, every document's term
+    counts are appended to a JSONL log that rebuilds the index on load
+    without re-tokenizing the store.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path, self.k1, self.b = path, k1, b
+        self.deleted: Set[int] = set()  # tombstoned rows, skipped by search
+        self.reset(keep_log=True)
+        if path and os.path.exists(path):
+            self._load()
+
+    def reset(self, keep_log: bool = False) -> None:
+        """Forget every document (and delete the log unless `keep_log`)."""
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: List[int] = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+        if not keep_log and self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> None:
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn write from an interrupted append
+                if not line.endswith(b"\n") or entry["row"] != len(self.lengths):
+                    break
+                self._index(entry["terms"])
+                good += len(line)
+        if os.path.getsize(self.path) > good:
+            os.truncate(self.path, good)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def _index(self, counts: Dict[str, int]) -> None:
+        row = len(self.lengths)
+        for term, tf in counts.items():
+            self.postings[term][row] = tf
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self._total_length += length
+
+    def extend(self, texts: Sequence[str]) -> None:
+        with self._lock:
+            entries = []
+            for text in texts:
+                counts = dict(Counter(tokenize(text)))
+                entries.append({"row": len(self.lengths), "terms": counts})
+                self._index(counts)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e) + "\n" for e in entries)
+
+    def add(self, text: str) -> None:
+        self.extend([text])
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """`(row, BM25 score)` pairs for rows sharing a term with `query`, best first."""
+        terms = set(tokenize(query))
+        with self._lock:  # the writer thread may be extending these dicts
+            n, total_length = len(self.lengths), self._total_length
+            matched = {t: dict(self.postings[t]) for t in terms if t in self.postings}
+        if not n:
+            return []
+        avg_length = total_length / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for postings in matched.values():
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for row, tf in postings.items():
+                if row in self.deleted:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / avg_length)
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:k] if k is not None else ranked
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]], k: int = 60
+) -> List[Tuple[int, float]]:
+    """Fuse best-first row rankings: each row scores sum(1 / (k + rank))."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            scores[row] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+# ── group commit ─────────────────────────────────────────────────
+class GroupCommitWriter:
+    """
+    Serializes appends through one background thread. Everything queued
+    while a commit is running goes into the next batch, so `commit(batch)`
+    (and its lock + fsync) runs once per batch instead of once per item.
+    `submit` returns a Future that resolves once the item's batch is durable,
+    to the item's entry in the list `commit` returns (or None).
+    """
+
+    def __init__(self, commit: Callable[[List], Optional[List]], max_batch: int = 256):
+        self.commit, self.max_batch = commit, max_batch
+        self.batches = self.items = 0
+        self._queue: "queue.Queue[Tuple[object, Future]]" = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            while len(pending) < self.max_batch:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = self.commit([item for item, _ in pending])
+            except Exception as exc:
+                for _, future in pending:
+                    future.set_exception(exc)
+                continue
+            self.batches, self.items = self.batches + 1, self.items + len(pending)
+            for i, (_, future) in enumerate(pending):
+                future.set_result(None if results is None else results[i])
+
+
+# ── binary store ─────────────────────────────────────────────────
+class BinaryMemoryStore:
+    """
+    Append-only memory store. Normalized embeddings are raw float32 (or
+    float16) rows in `<base>.vectors`, read back with `np.memmap` so loading
+    is instant and worker processes share the page cache; memory texts and
+    their row numbers are lines of the `<base>.meta.jsonl` sidecar, and the
+    row width lives in `<base>.header.json`, along with the JSONL store it
+    was migrated from, if any.
+    """
+
+    def __init__(self, base_path: str, dtype: str = "float32"):
+        self.vectors_path = f"{base_path}.vectors"
+        self.meta_path = f"{base_path}.meta.jsonl"
+        self.header_path = f"{base_path}.header.json"
+        self.lock_path = f"{base_path}.lock"
+        self.dtype, self.dim = np.dtype(dtype), None
+        self.migrated: Optional[str] = None
+        with file_lock(self.lock_path):
+            self._read_header()
+            self._recover()
+
+    def _read_header(self) -> None:
+        if os.path.exists(self.header_path):
+            with open(self.header_path, encoding="utf-8") as f:
+                header = json.load(f)
+            self.dtype, self.dim = np.dtype(header["dtype"]), header["dim"]
+            self.migrated = header.get("migrated")
+
+    def _write_header(self) -> None:
+        header = {"dim": self.dim, "dtype": self.dtype.name, "migrated": self.migrated}
+        with open(self.header_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+
+    def _create(self, dim: int) -> None:
+        """Header plus empty vector and sidecar files for `dim`-wide rows."""
+        self.dim = dim
+        self._write_header()
+        open(self.vectors_path, "wb").close()
+        open(self.meta_path, "wb").close()
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _read_meta(self) -> Tuple[List[str], int]:
+        """Texts by row plus the byte length of the sidecar's intact prefix."""
+        texts, good = [], 0
+        if not os.path.exists(self.meta_path):
+            return texts, good
+        with open(self.meta_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn write from an interrupted append
+                if not line.endswith(b"\n") or entry["row"] != len(texts):
+                    break
+                texts.append(entry["memory"])
+                good += len(line)
+        return texts, good
+
+    def _recover(self) -> None:
+        """Trim a torn sidecar line and any vector rows that have no sidecar entry."""
+        if self.dim is None:
+            return
+        texts, good = self._read_meta()
+        if os.path.getsize(self.meta_path) > good:
+            os.truncate(self.meta_path, good)
+        rows = os.path.getsize(self.vectors_path) // self._row_bytes
+        if rows < len(texts):
+            # vectors are written first, so this only happens if the file was damaged
+            with open(self.meta_path, "rb") as f:
+                keep = sum(len(line) for _, line in zip(range(rows), f))
+            os.truncate(self.meta_path, keep)
+        os.truncate(self.vectors_path, min(rows, len(texts)) * self._row_bytes)
+
+    def __len__(self) -> int:
+        if self.dim is None:
+            return 0
+        return os.path.getsize(self.vectors_path) // self._row_bytes
+
+    def load(self) -> Tuple[List[str], np.ndarray]:
+        texts, _ = self._read_meta()
+        if not texts:
+            return [], np.empty((0, self.dim or 0), dtype=np.float32)
+        matrix = np.memmap(
+            self.vectors_path, dtype=self.dtype, mode="r", shape=(len(texts), self.dim)
+        )
+        return texts, matrix
+
+    def extend(self, texts: Sequence[str], embeddings: np.ndarray) -> None:
+        with file_lock(self.lock_path):
+            self._extend_locked(texts, embeddings)
+
+    def _extend_locked(self, texts: Sequence[str], embeddings: np.ndarray) -> None:
+        """`extend` for a caller that already holds `lock_path`."""
+        rows = normalize(np.atleast_2d(embeddings))
+        if self.dim is None:
+            self._read_header()  # another process may have created the store
+        if self.dim is None:
+            self._create(rows.shape[1])
+        elif rows.shape[1] != self.dim:
+            raise ValueError(
+                f"embedding has {rows.shape[1]} dims, store has {self.dim}"
+            )
+        first = len(self)
+        # vectors first: a crash in between leaves rows that _recover() drops
+        with open(self.vectors_path, "ab") as f:
+            f.write(rows.astype(self.dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        append_lines(
+            self.meta_path,
+            [
+                json.dumps({"row": row, "memory": text})
+                for row, text in enumerate(texts, first)
+            ],
+        )
+
+    def add(self, text: str, embedding: np.ndarray) -> None:
+        self.extend([text], embedding)
+
+
+def migrate_jsonl(jsonl_path: str, store: BinaryMemoryStore, batch: int = 1024) -> int:
+    """
+    One-shot copy of a `{"memory", "embedding"}` JSONL store into `store`.
+    Runs under the store's lock and records the migration in its header, so
+    racing processes migrate only once and a store emptied by compaction is
+    not refilled. Copies nothing (returns 0) if `store` already has rows.
+    """
+    migrated, texts, embeddings = 0, [], []
+    recover_jsonl(jsonl_path)  # a torn last line would fail json.loads
+    with file_lock(store.lock_path):
+        store._read_header()
+        if store.migrated is not None or len(store):
+            return 0
+        with open(jsonl_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                texts.append(record["memory"])
+                embeddings.append(record["embedding"])
+                if len(texts) == batch:
+                    store._extend_locked(texts, np.array(embeddings, dtype=np.float32))
+                    migrated, texts, embeddings = migrated + len(texts), [], []
+        if texts:
+            store._extend_locked(texts, np.array(embeddings, dtype=np.float32))
+            migrated += len(texts)
+        store.migrated = os.path.basename(jsonl_path)
+        store._write_header()
+    return migrated
+
+
+# ── tombstones & compaction ──────────────────────────────────────
+class Tombstones:
+    """
+    Ids of deleted memories, one JSON string per line, kept until the next
+    compaction.
+    Row numbers are only meaningful inside one process (another process may
+    append in between), so a row is identified by its text's hash plus how
+    many earlier rows hold the same text, which every process agrees on.
+    """
+
+    def __init__(self, path: str):
+        self.path, self.keys = path, set()
+        if os.path.exists(path):
+            recover_jsonl(path)
+            with open(path, encoding="utf-8") as f:
+                self.keys.update(json.loads(line) for line in f if line.strip())
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def key(texts: Sequence[str], row: int) -> str:
+        text = texts[row]
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{digest}:{texts[:row].count(text)}"
+
+    def add(self, texts: Sequence[str], rows: Iterable[int]) -> None:
+        """Tombstone `rows` of a store whose memories, in row order, are `texts`."""
+        keys = sorted({self.key(texts, row) for row in rows} - self.keys)
+        if keys:
+            append_lines(self.path, [json.dumps(key) for key in keys])
+            self.keys.update(keys)
+
+    def rows(self, texts: Sequence[str]) -> Set[int]:
+        """Tombstoned rows of a store whose memories, in row order, are `texts`."""
+        if not self.keys:
+            return set()
+        deleted, seen = set(), Counter()
+        for row, text in enumerate(texts):
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if f"{digest}:{seen[digest]}" in self.keys:
+                deleted.add(row)
+            seen[digest] += 1
+        return deleted
+
+
+def store_files(store_path: str) -> Dict[str, str]:
+    """Paths of a store (`*.jsonl` file or binary base path) and of its derived files."""
+    base = store_path.removesuffix(".jsonl")
+    return {
+        "ann": f"{base}.ivf.npz",
+        "quantized": f"{base}.bits.npz",
+        "terms": f"{base}.terms.jsonl",
+        "tombstones": f"{base}.tombstones",
+    }
+
+
+def _surviving_rows(
+    texts: Sequence[str],
+    matrix: np.ndarray,
+    deleted: Set[int],
+    threshold: float,
+    block: int = 1024,
+) -> np.ndarray:
+    """Live rows, keeping only the first row of every group of near-duplicates."""
+    live = np.setdiff1d(np.arange(len(texts)), list(deleted))
+    kept, keep = MemoryIndex(), []
+    for start in range(0, len(live), block):
+        ids = live[start : start + block]
+        vectors = matrix[ids]
+        ids = ids[kept.novel(vectors, threshold)]
+        kept.extend([texts[i] for i in ids], matrix[ids])
+        keep.extend(ids)
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _file_bytes(paths: Iterable[str]) -> int:
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def compact_store(store_path: str, threshold: float = 0.95) -> Dict[str, int]:
+    """
+    Rewrite a store without tombstoned rows and near-duplicates (cosine
+    above `threshold`; the oldest copy is kept), then drop its tombstones
+    and the ANN and keyword files, which are rebuilt on next use. Meant to
+    run offline: processes holding the store open keep their old row ids.
+    Returns memory counts and on-disk bytes before and after.
+    """
+    files = store_files(store_path)
+    tombstones = Tombstones(files["tombstones"])
+    if store_path.endswith(".jsonl"):
+        recover_jsonl(store_path)
+        with file_lock(store_path + ".lock"):
+            with open(store_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            texts = [r["memory"] for r in records]
+            matrix = np.array([r["embedding"] for r in records], dtype=np.float32)
+            keep = _surviving_rows(texts, matrix, tombstones.rows(texts), threshold)
+            paths = [store_path]
+            before = _file_bytes(paths)
+            with open(store_path + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(records[i]) + "\n" for i in keep)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(store_path + ".tmp", store_path)
+    else:
+        store = BinaryMemoryStore(store_path)
+        paths = [store.vectors_path, store.meta_path, store.header_path]
+        with file_lock(store.lock_path):
+            texts, matrix = store.load()
+            keep = _surviving_rows(texts, matrix, tombstones.rows(texts), threshold)
+            before = _file_bytes(paths)
+            tmp_base = store_path + ".tmp"
+            tmp_paths = [p.replace(store_path, tmp_base, 1) for p in paths]
+            for path in tmp_paths:  # leftovers of an interrupted compaction
+                if os.path.exists(path):
+                    os.remove(path)
+            compacted = BinaryMemoryStore(tmp_base, store.dtype.name)
+            compacted.migrated = store.migrated  # even with no rows left
+            if store.dim is not None:
+                compacted._create(store.dim)
+            for start in range(0, len(keep), 1 << 16):
+                ids = keep[start : start + (1 << 16)]
+                compacted.extend([texts[i] for i in ids], matrix[ids])
+            for old, new in zip(paths, tmp_paths):
+                if os.path.exists(new):
+                    os.replace(new, old)
+                elif os.path.exists(old):  # nothing survived
+                    os.remove(old)
+            for lock in (compacted.lock_path, compacted.meta_path + ".lock"):
+                if os.path.exists(lock):
+                    os.remove(lock)
+    for path in files.values():
+        if os.path.exists(path):
+            os.remove(path)
+    return {
+        "memories_before": len(texts),
+        "memories_after": len(keep),
+        "bytes_before": before,
+        "bytes_after": _file_bytes(paths),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory store maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser(
+        "migrate", help="copy a JSONL store into a binary one"
+    )
+    migrate.add_argument("jsonl", nargs="?", default="memory_store.jsonl")
+    migrate.add_argument("base", nargs="?", default="memory_store")
+    migrate.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    compact = commands.add_parser(
+        "compact", help="drop deleted and near-duplicate memories from a store"
+    )
+    compact.add_argument(
+        "store",
+        nargs="?",
+        default="memory_store.jsonl",
+        help="a .jsonl store or the base path of a binary one",
+    )
+    compact.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_jsonl(args.jsonl, BinaryMemoryStore(args.base, args.dtype))
+        print(f"Migrated {count} memories from {args.jsonl} to {args.base}.vectors")
+    elif args.command == "compact":
+        report = compact_store(args.store, args.threshold)
+        print(
+            f"Compacted {args.store}: "
+            f"{report['memories_before']} -> {report['memories_after']} memories, "
+            f"{report['bytes_before']:,} -> {report['bytes_after']:,} bytes"
+        )
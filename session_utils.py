@@ -0,0 +1,116 @@
+"""
+Conversation state for serving many chat sessions from one process.
+
+A session only needs two things to continue: the name of the agent that
+answered last and the id of its last response (`previous_response_id`).
+`SessionStore` keeps them in a bounded in-memory LRU, optionally written
+through to SQLite so conversations survive a restart.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class Session:
+    agent_name: str
+    previous_response_id: Optional[str] = None
+    updated_at: float = 0.0
+
+
+class SessionStore:
+    """Thread-safe LRU of sessions by id, with optional SQLite write-through."""
+
+    def __init__(self, maxsize: int = 10_000, path: Optional[str] = None):
+        self.maxsize, self.path = maxsize, path
+        self.hits = self.misses = self.evictions = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        # one asyncio lock per live session, so its turns run one at a time
+        self._turn_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(
+                path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, agent TEXT NOT NULL,"
+                " response_id TEXT, updated REAL NOT NULL)"
+            )
+
+    def _remember(self, session_id: str, session: Session) -> None:
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT agent, response_id, updated FROM sessions WHERE id = ?",
+                    (session_id,),
+                ).fetchone()
+                if row is not None:
+                    session = Session(*row)
+            if session is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(session_id, session)
+            return session
+
+    def put(
+        self, session_id: str, agent_name: str, previous_response_id: Optional[str]
+    ) -> Session:
+        session = Session(agent_name, previous_response_id, time.time())
+        with self._lock:
+            self._remember(session_id, session)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                    (
+                        session_id,
+                        session.agent_name,
+                        session.previous_response_id,
+                        session.updated_at,
+                    ),
+                )
+        return session
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def turn_lock(self, session_id: str) -> asyncio.Lock:
+        """Lock to hold for a whole turn; messages to one session must not interleave."""
+        with self._lock:
+            lock = self._turn_locks.get(session_id)
+            if lock is None:
+                lock = self._turn_locks[session_id] = asyncio.Lock()
+            return lock
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "cached": len(self._sessions),
+            }
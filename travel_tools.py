@@ -0,0 +1,41 @@
+"""
+Tools of the travel-agency agents, shared by _4_multi_agents.py and the
+eval agent graphs in eval_utils.py. Importing this module has no side
+effects (no weave.init, no trace processors).
+"""
+
+from agents import function_tool
+
+from utils import pure_tool
+
+
+@function_tool
+@pure_tool
+def search_flights(origin: str, destination: str, date: str):
+    return f"Flights {origin}->{destination} on {date}: FL123, FL456"
+
+
+@function_tool
+def search_hotels(city: str, checkin: str, nights: int):
+    return f"Hotels in {city} from {checkin} for {nights} nights: Hotel Foo, Hotel Bar"
+
+
+@function_tool
+def submit_flight_claim(flight_number: str, date: str, issue: str):
+    return f"Claim submitted for {flight_number} on {date} ({issue}). Ref CLM‑0001"
+
+
+@function_tool
+@pure_tool
+def get_faq(topic: str):
+    data = {
+        "baggage": "Carry‑on 8 kg, checked 23 kg.",
+        "refund": "Refunds processed in 5‑7 days.",
+    }
+    return data.get(topic.lower(), "No FAQ available for that topic.")
+
+
+TOOLS = {
+    tool.name: tool
+    for tool in (search_flights, search_hotels, submit_flight_claim, get_faq)
+}
@@ -1,10 +1,26 @@
 """
-Reusable helpers for MiniAgent (colourful logging, schema generation, etc.).
+Reusable helpers for MiniAgent (colourful logging, schema generation, tool caching, etc.).
 """
 
+import contextvars
+import functools
 import inspect
+import json
+import os
 import re
-from typing import Any, Dict
+import threading
+import time
+import types
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still serialized within a process
+    fcntl = None
 
 # ── ANSI colour tags ──────────────────────────────────────────────
 _CLR: Dict[str, str] = {
@@ -29,13 +45,128 @@ def strip_ansi(s: str) -> str:
     return re.sub(r"\x1b\[[0-9;]*m", "", s)
 
 
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+# ── thread fan-out ───────────────────────────────────────────────
+def parallel_map(fn: Callable, items: Iterable, max_workers: Optional[int] = None):
+    """Apply `fn` to every item in a thread pool; results keep the input order."""
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or len(items)) as pool:
+        # copy the context per task so weave nests the calls under the caller
+        futures = [
+            pool.submit(contextvars.copy_context().run, fn, item) for item in items
+        ]
+        return [f.result() for f in futures]
+
+
+# ── durable appends ──────────────────────────────────────────────
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on `path` across processes (no-op without fcntl)."""
+    with open(path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def append_lines(path: str, lines: Sequence[str]) -> None:
+    """Append `lines` under the file's lock with a single fsync."""
+    with file_lock(path + ".lock"), open(path, "a", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def recover_jsonl(path: str) -> int:
+    """Cut a torn trailing line (unterminated or not JSON) left by a crash; returns bytes cut."""
+    if not os.path.exists(path):
+        return 0
+    with file_lock(path + ".lock"), open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - (1 << 20)))  # a torn line sits in the last bytes
+        tail = f.read()
+        good = size
+        if tail and not tail.endswith(b"\n"):
+            good = size - len(tail) + tail.rfind(b"\n") + 1
+        else:
+            last = tail[:-1].rsplit(b"\n", 1)[-1]
+            try:
+                json.loads(last or b"null")
+            except ValueError:
+                good = size - len(last) - 1
+        f.truncate(good)
+        return size - good
+
+
 # ── schema helper ────────────────────────────────────────────────
+_JSON_TYPES: Dict[type, str] = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+}
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    """Optional[X] / X | None -> X; anything else unchanged."""
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _json_schema(annotation: Any) -> Dict[str, Any]:
+    annotation = _unwrap_optional(annotation)
+    origin = typing.get_origin(annotation) or annotation
+    schema = {"type": _JSON_TYPES.get(origin, "string")}
+    item_args = typing.get_args(annotation)
+    if schema["type"] == "array" and len(item_args) == 1:
+        schema["items"] = _json_schema(item_args[0])
+    return schema
+
+
+@functools.lru_cache(maxsize=None)
+def _parameters(fn) -> Tuple[Tuple[str, Any, bool], ...]:
+    """(name, python type, required) per parameter, resolved once per function."""
+    try:
+        hints = typing.get_type_hints(fn)
+    except (NameError, TypeError):
+        hints = {}
+    params = []
+    for p in inspect.signature(fn).parameters.values():
+        has_default = p.default is not inspect.Parameter.empty
+        if p.name in hints:
+            annotation = hints[p.name]
+        elif has_default and p.default is not None:
+            annotation = type(p.default)
+        else:
+            annotation = str
+        params.append((p.name, annotation, not has_default))
+    return tuple(params)
+
+
+@functools.lru_cache(maxsize=None)
 def fn_to_schema(fn) -> Dict[str, Any]:
     """
-    Build a minimal function‑tool schema from a python callable.
-    All parameters are typed as string for brevity.
+    Build a function‑tool schema from a python callable, once per function.
+    Types come from annotations (else the default's type, else string) and
+    parameters with defaults are optional. Treat the result as read‑only.
     """
-    props = {p: {"type": "string"} for p in inspect.signature(fn).parameters}
+    params = _parameters(fn)
+    props = {name: _json_schema(annotation) for name, annotation, _ in params}
     docstring = inspect.getdoc(fn) or ""
     return {
         "type": "function",
@@ -44,7 +175,140 @@ def fn_to_schema(fn) -> Dict[str, Any]:
         "parameters": {
             "type": "object",
             "properties": props,
-            "required": list(props),
+            "required": [name for name, _, required in params if required],
             "additionalProperties": True,
         },
     }
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+_COERCERS: Dict[type, Callable[[Any], Any]] = {int: int, float: float, bool: _to_bool}
+
+
+@functools.lru_cache(maxsize=None)
+def arg_parser(fn) -> Callable[[Optional[str]], Dict[str, Any]]:
+    """
+    Precompute a parser for a tool's JSON call arguments. Only scalar
+    parameters that arrive with the wrong JSON type are converted, so a
+    well-typed call costs a single `json.loads`.
+    """
+    coercers = {}
+    for name, annotation, _ in _parameters(fn):
+        annotation = _unwrap_optional(annotation)
+        if annotation in _COERCERS:
+            coercers[name] = (annotation, _COERCERS[annotation])
+
+    def parse(arguments: Optional[str]) -> Dict[str, Any]:
+        args = json.loads(arguments or "{}")
+        for name, (expected, coerce) in coercers.items():
+            value = args.get(name)
+            if value is not None and type(value) is not expected:
+                args[name] = coerce(value)
+        return args
+
+    return parse
+
+
+# ── pure-tool memoization ────────────────────────────────────────
+class ToolCache:
+    """Thread-safe LRU of tool results, bounded in size and optionally by age."""
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.hits = self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                self.ttl is None or time.monotonic() - entry[1] < self.ttl
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def store(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+_PURE_TOOLS: Dict[str, ToolCache] = {}
+
+
+def pure_tool_stats() -> Dict[str, Dict[str, int]]:
+    """Cache stats of every `@pure_tool` in the process, e.g. ones wrapped by `function_tool`."""
+    return {name: cache.stats() for name, cache in _PURE_TOOLS.items()}
+
+
+def canonical_args(arguments: Dict[str, Any]) -> str:
+    """Order-independent cache key for a set of call arguments."""
+    return json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def pure_tool(fn=None, *, maxsize: int = 256, ttl: Optional[float] = None):
+    """
+    Mark a deterministic tool as pure: identical calls are served from a
+    bounded LRU (see `ToolCache`) attached to the tool as `.cache`.
+    Use bare (`@pure_tool`) or with options (`@pure_tool(maxsize=64, ttl=300)`).
+    """
+
+    def decorate(fn):
+        cache = ToolCache(maxsize, ttl)
+        signature = inspect.signature(fn)
+
+        def key_for(args, kwargs) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return canonical_args(bound.arguments)
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                key = key_for(args, kwargs)
+                hit, value = cache.lookup(key)
+                if not hit:
+                    value = await fn(*args, **kwargs)
+                    cache.store(key, value)
+                return value
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = key_for(args, kwargs)
+                hit, value = cache.lookup(key)
+                if not hit:
+                    value = fn(*args, **kwargs)
+                    cache.store(key, value)
+                return value
+
+        wrapper.cache = _PURE_TOOLS[fn.__qualname__] = cache
+        return wrapper
+
+    return decorate(fn) if fn is not None else decorate